@@ -0,0 +1,579 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import config
+import disk_lru
+
+try:
+    import numpy as np
+except ImportError:  # optional: float evaluator falls back to a Python loop
+    np = None
+
+# canonical expected outputs persisted between runs
+CACHE_DIR = Path(__file__).resolve().parent / 'data' / 'expected_cache'
+
+
+def normalize_text(b: bytes):
+    """Decode output bytes, unify line endings and strip trailing spaces."""
+    s = _decode(b).replace('\r\n', '\n').strip()
+    # normalize each line by stripping trailing spaces
+    lines = [ln.rstrip() for ln in s.split('\n')]
+    return '\n'.join(lines)
+
+
+def _decode(b: bytes) -> str:
+    # bytes that are not valid UTF-8 become lone surrogates and are encoded
+    # back unchanged: every line decodes the same whatever the rest of the
+    # output holds, so the streaming checkers agree with canonical()
+    return b.decode('utf-8', 'surrogateescape')
+
+
+def _encode(s: str) -> bytes:
+    return s.encode('utf-8', 'surrogateescape')
+
+
+def _shown(s: str) -> str:
+    """s for display, undecodable bytes shown as U+FFFD."""
+    return _encode(s).decode('utf-8', errors='replace')
+
+
+def canonical(b: bytes, ignore_case: bool = False, mode: str = 'lines') -> bytes:
+    """Canonical form used for comparison, encoded back to bytes (bytes that
+    are not valid UTF-8 are kept as they are):
+
+    - 'bytes': the raw output;
+    - 'lines': normalize_text (trailing spaces and surrounding blank lines dropped);
+    - 'lines-words': every line reduced to its words joined by one space;
+    - 'words' / 'float': the whole output as one space-separated token list.
+
+    IgnoreCase evaluators lowercase the result.
+    """
+    if mode == 'bytes':
+        return b.lower() if ignore_case else b
+    if mode == 'lines':
+        s = normalize_text(b)
+    else:
+        s = _decode(b)
+        if mode == 'lines-words':
+            lines = [' '.join(ln.split()) for ln in s.split('\n')]
+            while lines and not lines[-1]:
+                lines.pop()
+            start = 0
+            while start < len(lines) and not lines[start]:
+                start += 1
+            s = '\n'.join(lines[start:])
+        else:
+            s = ' '.join(s.split())
+    if ignore_case:
+        s = s.lower()
+    return _encode(s)
+
+
+def digest(b: bytes) -> str:
+    return hashlib.sha256(b).hexdigest()
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ExpectedCache:
+    """Expected outputs in canonical form, normalized once per evaluator mode.
+
+    Entries are keyed by (sha256 of the raw file, mode) and kept in a
+    byte-bounded in-memory LRU shared by all grading threads; misses are
+    looked up in data/expected_cache/ (first line digest, then canonical
+    bytes) before the file is read and normalized. With max_disk_bytes that
+    directory is an LRU of at most that size (see disk_lru).
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, cache_dir=CACHE_DIR, max_disk_bytes: int = None):
+        self.max_bytes = max_bytes
+        self.cache_dir = Path(cache_dir)
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        # bytes saved since the directory was last trimmed (None: never)
+        self._unevicted = None
+
+    def get(self, path: str, ignore_case: bool = False, raw_sha256: str = None, mode: str = 'lines'):
+        """Return (canonical_bytes, digest) of the expected output at path."""
+        if not raw_sha256:
+            raw_sha256 = _file_sha256(path)
+        canon_mode = mode
+        mode = f"{mode}-{'ci' if ignore_case else 'cs'}-v{EVALUATOR_VERSION}"
+        key = (raw_sha256, mode)
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None:
+                self._entries.move_to_end(key)
+                return hit
+
+        entry = self._load_disk(raw_sha256, mode)
+        if entry is None:
+            with open(path, 'rb') as f:
+                canon = canonical(f.read(), ignore_case, canon_mode)
+            entry = (canon, digest(canon))
+            self._save_disk(raw_sha256, mode, entry)
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = entry
+                self._size += len(entry[0])
+                while self._size > self.max_bytes and len(self._entries) > 1:
+                    _, old = self._entries.popitem(last=False)
+                    self._size -= len(old[0])
+        return entry
+
+    def _disk_path(self, raw_sha256: str, mode: str) -> Path:
+        return self.cache_dir / f"{raw_sha256}.{mode}"
+
+    def _load_disk(self, raw_sha256: str, mode: str):
+        path = self._disk_path(raw_sha256, mode)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        head, _, canon = data.partition(b'\n')
+        dig = head.decode('ascii', errors='replace')
+        # a truncated write is detected by the digest
+        if digest(canon) != dig:
+            return None
+        disk_lru.touch(path)
+        return canon, dig
+
+    def _save_disk(self, raw_sha256: str, mode: str, entry):
+        canon, dig = entry
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            path = self._disk_path(raw_sha256, mode)
+            tmp = path.with_name(f".tmp{path.name}.{threading.get_ident()}")
+            tmp.write_bytes(dig.encode('ascii') + b'\n' + canon)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        if self.max_disk_bytes is None:
+            return
+        # scanning the directory on every save would cost more than the saves
+        with self._lock:
+            due = self._unevicted is None or self._unevicted + len(canon) > self.max_disk_bytes // 8
+            self._unevicted = 0 if due else self._unevicted + len(canon)
+        if due:
+            disk_lru.evict(self.cache_dir, self.max_disk_bytes)
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_cache() -> ExpectedCache:
+    """Process-wide ExpectedCache sized by setting.EXPECTED_CACHE_MAX_MB (in
+    memory) and setting.EXPECTED_CACHE_DISK_MB (on disk)."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ExpectedCache(config.get('EXPECTED_CACHE_MAX_MB', 256, int) * 1024 * 1024,
+                                           max_disk_bytes=disk_lru.max_bytes('EXPECTED_CACHE_DISK_MB', 1024))
+        return _default_cache
+
+
+def first_difference(out_canon: bytes, exp_canon: bytes, width: int = 200):
+    """Locate the first differing line for diagnostics: {'Line', 'Expected', 'Got'}."""
+    out_lines = out_canon.split(b'\n')
+    exp_lines = exp_canon.split(b'\n')
+    for i in range(max(len(out_lines), len(exp_lines))):
+        got = out_lines[i] if i < len(out_lines) else None
+        exp = exp_lines[i] if i < len(exp_lines) else None
+        if got != exp:
+            return {
+                'Line': i + 1,
+                'Expected': exp.decode('utf-8', errors='replace')[:width] if exp is not None else None,
+                'Got': got.decode('utf-8', errors='replace')[:width] if got is not None else None,
+            }
+    return None
+
+
+class LineStreamChecker:
+    """Incremental version of the canonical comparison for use while the
+    contestant is still running.
+
+    feed() takes raw stdout chunks and returns False as soon as a complete
+    line is known to differ (so the process can be killed); finish() settles
+    the last partial line and a too-short output. The verdict is the same as
+    comparing canonical() forms. The first difference is kept in .diff.
+    """
+
+    def __init__(self, exp_canon: bytes, ignore_case: bool = False, width: int = 200, words: bool = False):
+        text = _decode(exp_canon)
+        self.expected = text.split('\n') if text else []
+        self.ignore_case = ignore_case
+        self.words = words
+        self.width = width
+        self.partial = bytearray()
+        self._checked_len = 4096
+        self.index = 0
+        self.started = False
+        self.diff = None
+
+    def _line(self, raw: bytes) -> bool:
+        s = _decode(raw)
+        s = ' '.join(s.split()) if self.words else s.rstrip()
+        if not self.started:
+            # leading whitespace and blank lines are stripped by normalize_text
+            s = s.lstrip()
+            if not s:
+                return True
+            self.started = True
+        if self.ignore_case:
+            s = s.lower()
+        i = self.index
+        self.index += 1
+        if i < len(self.expected):
+            if s == self.expected[i]:
+                return True
+            exp = self.expected[i]
+        elif not s:
+            # blank lines past the end only matter if content follows
+            return True
+        else:
+            exp = None
+        self.diff = {'Line': i + 1, 'Expected': _shown(exp[:self.width]) if exp is not None else None,
+                     'Got': _shown(s[:self.width])}
+        return False
+
+    def feed(self, chunk: bytes) -> bool:
+        if self.diff:
+            return False
+        self.partial += chunk
+        if b'\n' in chunk:
+            lines = self.partial.split(b'\n')
+            self.partial = bytearray(lines.pop())
+            for raw in lines:
+                if not self._line(raw):
+                    return False
+        if len(self.partial) > self._checked_len * 2:
+            return self._check_overlong()
+        return True
+
+    def _check_overlong(self) -> bool:
+        """Fail a line that is already longer than the expected one instead of
+        buffering it until the program ends (e.g. endless output without newline).
+        """
+        self._checked_len = len(self.partial)
+        i = self.index
+        exp = self.expected[i] if i < len(self.expected) else ''
+        # an equal line can never have more raw bytes than twice its canonical form
+        bound = 2 * len(_encode(exp)) + 16
+        if len(self.partial) <= bound:
+            return True
+        content = self.partial.strip() if not self.started else self.partial.rstrip()
+        # in words mode runs of spaces collapse, so only non-space bytes count
+        size = len(content.translate(None, b' \t\r\x0b\x0c')) if self.words else len(content)
+        if size <= bound:
+            return True
+        got = bytes(content[:self.width]).decode('utf-8', errors='replace')
+        self.diff = {'Line': i + 1, 'Expected': _shown(exp[:self.width]) if i < len(self.expected) else None,
+                     'Got': got}
+        return False
+
+    def finish(self) -> bool:
+        if self.diff:
+            return False
+        if self.partial:
+            if not self._line(bytes(self.partial)):
+                return False
+            self.partial = bytearray()
+        if self.index < len(self.expected):
+            self.diff = {'Line': self.index + 1, 'Expected': _shown(self.expected[self.index][:self.width]),
+                         'Got': None}
+            return False
+        return True
+
+
+class BytesStreamChecker:
+    """Exact byte comparison while the program runs ('bytes' evaluators)."""
+
+    def __init__(self, exp_canon: bytes, ignore_case: bool = False, width: int = 200):
+        self.expected = exp_canon
+        self.ignore_case = ignore_case
+        self.width = width
+        self.pos = 0
+        self.diff = None
+
+    def feed(self, chunk: bytes) -> bool:
+        if self.diff:
+            return False
+        if self.ignore_case:
+            chunk = chunk.lower()
+        end = self.pos + len(chunk)
+        if self.expected[self.pos:end] != chunk:
+            exp = self.expected[self.pos:end]
+            k = next((i for i, (a, b) in enumerate(zip(chunk, exp)) if a != b), min(len(chunk), len(exp)))
+            self._fail(self.pos + k, chunk[k:])
+            return False
+        self.pos = end
+        return True
+
+    def _fail(self, offset: int, got: bytes):
+        exp = self.expected[offset:offset + self.width]
+        self.diff = {'Byte': offset, 'Expected': exp.decode('utf-8', errors='replace') if exp else None,
+                     'Got': got[:self.width].decode('utf-8', errors='replace') if got else None}
+
+    def finish(self) -> bool:
+        if self.diff:
+            return False
+        if self.pos != len(self.expected):
+            self._fail(self.pos, b'')
+            return False
+        return True
+
+
+_TRAILING_TOKEN = re.compile(rb'\S*\Z')
+
+
+class TokenStreamChecker:
+    """Token comparison while the program runs ('words' evaluators).
+
+    Complete tokens of each chunk are canonicalized together and compared as
+    one slice of the canonical expected output, so the per-chunk work runs in
+    C rather than a Python loop over tokens.
+    """
+
+    def __init__(self, exp_canon: bytes, ignore_case: bool = False, width: int = 200):
+        self.expected = exp_canon
+        self.ignore_case = ignore_case
+        self.width = width
+        self.longest = max(map(len, exp_canon.split(b' ')), default=0)
+        self.partial = bytearray()
+        self.pos = 0
+        self.count = 0
+        self.diff = None
+
+    def _piece(self, raw: bytes) -> bool:
+        piece = canonical(raw, self.ignore_case, 'words')
+        if not piece:
+            return True
+        start = self.pos + 1 if self.pos else 0
+        end = start + len(piece)
+        exp = self.expected
+        if (start == 0 or exp[self.pos:start] == b' ') and exp[start:end] == piece \
+                and (end == len(exp) or exp[end:end + 1] == b' '):
+            self.pos = end
+            self.count += piece.count(b' ') + 1
+            return True
+        self._fail(piece.split(b' '), exp[start:].split(b' ', len(piece.split(b' '))))
+        return False
+
+    def _fail(self, got_tokens: list, exp_tokens: list):
+        for i, got in enumerate(got_tokens):
+            exp = exp_tokens[i] if i < len(exp_tokens) and exp_tokens[i] else None
+            if got != exp:
+                break
+        else:
+            i, got, exp = len(got_tokens), None, exp_tokens[len(got_tokens)] if len(exp_tokens) > len(got_tokens) else None
+        self.diff = {'Token': self.count + i + 1,
+                     'Expected': exp[:self.width].decode('utf-8', errors='replace') if exp else None,
+                     'Got': got[:self.width].decode('utf-8', errors='replace') if got else None}
+
+    def feed(self, chunk: bytes) -> bool:
+        if self.diff:
+            return False
+        self.partial += chunk
+        cut = _TRAILING_TOKEN.search(self.partial).start()
+        if cut:
+            complete = bytes(self.partial[:cut])
+            del self.partial[:cut]
+            if not self._piece(complete):
+                return False
+        # a token already longer than any expected one can only be wrong
+        if len(self.partial) > 2 * self.longest + 16:
+            self._fail([bytes(self.partial[:self.width])], self.expected[self.pos:].lstrip(b' ').split(b' ', 1))
+            return False
+        return True
+
+    def finish(self) -> bool:
+        if self.diff:
+            return False
+        if self.partial and not self._piece(bytes(self.partial)):
+            return False
+        self.partial = bytearray()
+        if self.pos != len(self.expected):
+            rest = self.expected[self.pos:].lstrip(b' ').split(b' ', 1)
+            self.diff = {'Token': self.count + 1, 'Expected': rest[0][:self.width].decode('utf-8', errors='replace'),
+                         'Got': None}
+            return False
+        return True
+
+
+def _float_tolerance() -> float:
+    return config.get('FLOAT_TOLERANCE', 1e-6, float)
+
+
+def compare_floats(out_canon: bytes, exp_canon: bytes, tolerance: float, width: int = 200):
+    """Token comparison where numeric tokens may differ by tolerance
+    (absolute, or relative for values above 1); equal tokens always match.
+    Numeric columns are parsed and compared in one NumPy pass when NumPy is
+    installed, with the same result as without it.
+    Returns (passed, diff).
+    """
+    out_tokens = out_canon.split()
+    exp_tokens = exp_canon.split()
+    if len(out_tokens) != len(exp_tokens):
+        i = min(len(out_tokens), len(exp_tokens))
+    else:
+        i = None
+        if np is not None:
+            try:
+                # parsed token by token: an array of the byte strings would be
+                # as wide as the longest token times the token count
+                n = len(out_tokens)
+                got = np.fromiter(map(float, out_tokens), np.float64, n)
+                exp = np.fromiter(map(float, exp_tokens), np.float64, n)
+                with np.errstate(invalid='ignore'):
+                    ok = np.abs(got - exp) <= tolerance * np.maximum(1.0, np.abs(exp))
+                ok |= (got == exp)  # equal infinities
+                for k in np.flatnonzero(~ok):
+                    # equal tokens match, as in the loop below (so 'nan' matches 'nan')
+                    if out_tokens[k] != exp_tokens[k]:
+                        i = int(k)
+                        break
+                else:
+                    return True, None
+            except ValueError:
+                # non-numeric tokens present: compare one by one below
+                i = None
+        if i is None:
+            for k, (g, e) in enumerate(zip(out_tokens, exp_tokens)):
+                if g == e:
+                    continue
+                try:
+                    gv, ev = float(g), float(e)
+                except ValueError:
+                    i = k
+                    break
+                if not (abs(gv - ev) <= tolerance * max(1.0, abs(ev)) or gv == ev):
+                    i = k
+                    break
+            else:
+                return True, None
+    got = out_tokens[i] if i < len(out_tokens) else None
+    exp = exp_tokens[i] if i < len(exp_tokens) else None
+    return False, {'Token': i + 1,
+                   'Expected': exp[:width].decode('utf-8', errors='replace') if exp is not None else None,
+                   'Got': got[:width].decode('utf-8', errors='replace') if got is not None else None}
+
+
+# bump when a comparison changes meaning, so fingerprints of stored verdicts change too
+EVALUATOR_VERSION = 4
+
+MODES = ('bytes', 'lines', 'lines-words', 'words', 'float')
+
+
+class Evaluator:
+    """One comparison strategy: a mode from MODES plus case sensitivity."""
+
+    def __init__(self, name: str, mode: str, ignore_case: bool = False):
+        if mode not in MODES:
+            raise ValueError(f"unknown evaluator mode: {mode}")
+        self.name = name
+        self.mode = mode
+        self.ignore_case = ignore_case
+
+    @property
+    def streaming(self) -> bool:
+        """True when stdout can be judged while the program is still running."""
+        return self.mode != 'float'
+
+    def signature(self) -> str:
+        sig = f"{self.mode}:{'ci' if self.ignore_case else 'cs'}:v{EVALUATOR_VERSION}"
+        if self.mode == 'float':
+            sig += f":{_float_tolerance()!r}"
+        return sig
+
+    def expected(self, path: str, raw_sha256: str = None, cache: ExpectedCache = None):
+        return (cache or default_cache()).get(path, self.ignore_case, raw_sha256, self.mode)
+
+    def stream_checker(self, path: str, raw_sha256: str = None, cache: ExpectedCache = None):
+        """A feed()/finish() checker against the expected output, or None
+        when this evaluator needs the whole output (see check)."""
+        if not self.streaming:
+            return None
+        exp_canon, _ = self.expected(path, raw_sha256, cache)
+        if self.mode == 'bytes':
+            return BytesStreamChecker(exp_canon, self.ignore_case)
+        if self.mode == 'words':
+            return TokenStreamChecker(exp_canon, self.ignore_case)
+        return LineStreamChecker(exp_canon, self.ignore_case, words=self.mode == 'lines-words')
+
+    def check(self, stdout: bytes, path: str, raw_sha256: str = None, cache: ExpectedCache = None):
+        """Judge a complete output. Returns (passed, diff)."""
+        exp_canon, exp_digest = self.expected(path, raw_sha256, cache)
+        out_canon = canonical(stdout, self.ignore_case, self.mode)
+        if self.mode == 'float':
+            return compare_floats(out_canon, exp_canon, _float_tolerance())
+        if digest(out_canon) == exp_digest:
+            return True, None
+        if self.mode in ('lines', 'lines-words'):
+            return False, first_difference(out_canon, exp_canon)
+        sc = self.stream_checker(path, raw_sha256, cache)
+        sc.feed(stdout)
+        sc.finish()
+        return False, sc.diff
+
+
+EVALUATORS = {}
+
+
+def _key(name: str) -> str:
+    name = (name or '').strip().lower()
+    return name[:-4] if name.endswith('.dll') else name
+
+
+def register_evaluator(name: str, mode: str, ignore_case: bool = False) -> Evaluator:
+    """Map a Themis EvaluatorName (with or without .dll) to a comparison."""
+    ev = Evaluator(name, mode, ignore_case)
+    EVALUATORS[_key(name)] = ev
+    return ev
+
+
+# Themis built-in comparers
+register_evaluator('C1LinesWordsIgnoreCase.dll', 'lines-words', ignore_case=True)
+register_evaluator('C2LinesWordsCase.dll', 'lines-words')
+register_evaluator('C3WordsIgnoreCase.dll', 'words', ignore_case=True)
+register_evaluator('C4WordsCase.dll', 'words')
+# generic names
+for _mode in MODES:
+    register_evaluator(_mode, _mode)
+    register_evaluator(_mode + '-ignorecase', _mode, ignore_case=True)
+
+
+def get_evaluator(name: str) -> Evaluator:
+    """Registered evaluator for name; unknown names are guessed from their
+    keywords (Bytes/Binary, Real/Float/Double, Words, Lines, IgnoreCase) and
+    default to line comparison, as before the registry existed.
+    """
+    key = _key(name)
+    ev = EVALUATORS.get(key)
+    if ev is not None:
+        return ev
+    ignore_case = 'ignorecase' in key
+    if 'byte' in key or 'binary' in key or 'exact' in key:
+        mode = 'bytes'
+    elif 'real' in key or 'float' in key or 'double' in key or 'eps' in key:
+        mode = 'float'
+    elif 'words' in key and 'lines' in key:
+        mode = 'lines-words'
+    elif 'words' in key or 'token' in key:
+        mode = 'words'
+    else:
+        mode = 'lines'
+    return Evaluator(name, mode, ignore_case)
@@ -0,0 +1,133 @@
+import contextlib
+import hashlib
+import os
+import shlex
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+
+import disk_lru
+
+# Cache lives in data/, never next to the students' sources
+CACHE_DIR = Path(__file__).resolve().parent / 'data' / 'compile_cache'
+CXX = 'g++'
+COMPILE_CMD = CXX + " -O2 -std=gnu++17 {src} -o {out}"
+
+_versions = {}
+_lock = threading.Lock()
+_sessions = 0
+_pinned = set()
+
+
+def compiler_version(compiler: str = CXX) -> str:
+    """Return the first line of `<compiler> --version` (memoized per process)."""
+    if compiler not in _versions:
+        try:
+            proc = subprocess.run([compiler, '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=10)
+            _versions[compiler] = proc.stdout.decode('utf-8', errors='replace').splitlines()[0].strip()
+        except Exception:
+            _versions[compiler] = ''
+    return _versions[compiler]
+
+
+def cache_key(src_bytes: bytes, compile_cmd: str = COMPILE_CMD, version: str = None) -> str:
+    """Hash of source bytes + compiler command + compiler version."""
+    if version is None:
+        version = compiler_version()
+    h = hashlib.sha256()
+    for part in (compile_cmd.encode('utf-8'), version.encode('utf-8'), src_bytes):
+        h.update(len(part).to_bytes(8, 'little'))
+        h.update(part)
+    return h.hexdigest()
+
+
+def evict(max_bytes: int = None):
+    """Remove least recently used entries until the cache fits max_bytes,
+    never one compiled or looked up during a running session()."""
+    if max_bytes is None:
+        max_bytes = disk_lru.max_bytes('COMPILE_CACHE_MAX_MB', 512)
+    disk_lru.evict(CACHE_DIR, max_bytes, keep=_pinned)
+
+
+@contextlib.contextmanager
+def session():
+    """with session(): the binaries returned by compile_cpp stay in the cache
+    until the block ends (their tests may not have run yet); the cache is
+    trimmed once the last session is over."""
+    global _sessions
+    with _lock:
+        _sessions += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _sessions -= 1
+            if not _sessions:
+                _pinned.clear()
+                evict()
+
+
+def _pin(path: Path):
+    # called with _lock held
+    if _sessions:
+        _pinned.add(path.name)
+
+
+def compile_cpp(src_path: str, timeout: int = 20):
+    """Compile a C++ source through the cache.
+
+    Returns (bin_path, stderr): bin_path is None when compilation failed, in
+    which case stderr holds the compiler output. Failures are cached too, so
+    an unchanged broken source is not recompiled either.
+    """
+    with open(src_path, 'rb') as f:
+        src_bytes = f.read()
+    key = cache_key(src_bytes)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    bin_path = CACHE_DIR / key
+    err_path = CACHE_DIR / (key + '.err')
+
+    with _lock:
+        _pin(bin_path)
+        _pin(err_path)
+    if bin_path.is_file():
+        disk_lru.touch(bin_path)
+        return str(bin_path), b''
+    if err_path.is_file():
+        disk_lru.touch(err_path)
+        return None, err_path.read_bytes()
+
+    # compile into a temp name inside the cache, then publish atomically
+    fd, tmp_out = tempfile.mkstemp(prefix='.tmp', dir=CACHE_DIR)
+    os.close(fd)
+    cmd = COMPILE_CMD.format(src=shlex.quote(src_path), out=shlex.quote(tmp_out))
+    try:
+        cproc = subprocess.run(shlex.split(cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+        ok = cproc.returncode == 0
+        stderr = cproc.stderr
+    except subprocess.TimeoutExpired:
+        # timeouts are not cached: the machine may just have been busy
+        _remove(tmp_out)
+        return None, b'Compile timeout'
+    except Exception as e:
+        _remove(tmp_out)
+        return None, str(e).encode('utf-8')
+
+    if ok:
+        os.replace(tmp_out, bin_path)
+    else:
+        with open(tmp_out, 'wb') as f:
+            f.write(stderr)
+        os.replace(tmp_out, err_path)
+
+    with _lock:
+        evict()
+    return (str(bin_path) if ok else None), stderr
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
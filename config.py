@@ -0,0 +1,18 @@
+"""Access to the constants of setting.py."""
+
+
+def get(name: str, default=None, cast=None):
+    """setting.<name>, or default when it is missing or setting.py cannot be
+    imported. With cast the value is converted (cast(value)), and default is
+    returned when that fails; None is passed through unconverted."""
+    try:
+        import setting as _setting
+        value = getattr(_setting, name, default)
+    except Exception:
+        return default
+    if cast is None or value is None:
+        return value
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return default
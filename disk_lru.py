@@ -0,0 +1,64 @@
+"""Cache directories capped in size (data/compile_cache, data/test_cache,
+data/expected_cache).
+
+Entries are plain files. A file's mtime is its last use: hits touch() it and
+evict() removes the least recently used files first. Names starting with
+.tmp are files still being written; they are neither counted nor removed.
+"""
+import os
+
+import config
+
+
+def max_bytes(setting_name: str, default_mb: int) -> int:
+    """Size cap in bytes from setting.<setting_name> (MB)."""
+    return config.get(setting_name, default_mb, int) * 1024 * 1024
+
+
+def touch(path):
+    # mtime doubles as the LRU timestamp
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def usage(directory) -> int:
+    """Bytes held by the files of directory."""
+    total = 0
+    try:
+        with os.scandir(directory) as it:
+            for e in it:
+                if e.is_file() and not e.name.startswith('.tmp'):
+                    total += e.stat().st_size
+    except FileNotFoundError:
+        pass
+    return total
+
+
+def evict(directory, max_bytes: int, keep=()):
+    """Remove least recently used files of directory, never one named in
+    keep, until it fits max_bytes."""
+    entries = []
+    total = 0
+    try:
+        with os.scandir(directory) as it:
+            for e in it:
+                if not e.is_file() or e.name.startswith('.tmp'):
+                    continue
+                st = e.stat()
+                entries.append((st.st_mtime, st.st_size, e.name, e.path))
+                total += st.st_size
+    except FileNotFoundError:
+        return
+    entries.sort()
+    for _, size, name, path in entries:
+        if total <= max_bytes:
+            break
+        if name in keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
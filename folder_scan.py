@@ -0,0 +1,120 @@
+"""Single-pass scanner for the answer and submission folders.
+
+scan_folder reads every directory of a folder tree (down to max_depth)
+exactly once with os.scandir and keeps what the folder processing needs
+in a DirNode tree: the sub-directories and the wanted files, with their
+size and mtime when asked for. The top-level entries are scanned in
+parallel by a thread pool (setting.SCAN_WORKERS), which is what pays off on
+network shares where every directory read is a round trip.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+
+def scan_workers() -> int:
+    return max(1, config.get('SCAN_WORKERS', 8, int))
+
+
+class DirNode:
+    """One scanned directory: files maps a wanted file name to its
+    (size, mtime_ns) (None when not stat'ed), dirs a sub-directory name to
+    its DirNode (only for directories within max_depth)."""
+    __slots__ = ('path', 'files', 'dirs')
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files = {}
+        self.dirs = {}
+
+    def walk(self, depth: int):
+        """Yield (node, rel_depth) for this directory and the ones below it
+        down to depth levels, parents first and sub-directories by name."""
+        yield self, 0
+        if depth > 0:
+            for name in sorted(self.dirs):
+                for node, d in self.dirs[name].walk(depth - 1):
+                    yield node, d + 1
+
+    def files_within(self, depth: int, want=None):
+        """(name, path) of the files in this directory and depth levels below."""
+        for node, _ in self.walk(depth):
+            for name in sorted(node.files):
+                if want is None or want(name):
+                    yield name, os.path.join(node.path, name)
+
+    def metadata(self) -> dict:
+        """{path: (size, mtime_ns) or None} of every recorded file in the tree."""
+        meta = {os.path.join(self.path, name): m for name, m in self.files.items()}
+        for child in self.dirs.values():
+            meta.update(child.metadata())
+        return meta
+
+    def count(self):
+        """(directories, files) in the tree."""
+        dirs, files = 1, len(self.files)
+        for child in self.dirs.values():
+            d, f = child.count()
+            dirs += d
+            files += f
+        return dirs, files
+
+
+def _read_dir(path: str, want, with_stat: bool, follow_links: bool = False):
+    """One os.scandir of path: (DirNode with its wanted files, sub-directory paths)."""
+    node = DirNode(path)
+    subdirs = []
+    try:
+        it = os.scandir(path)
+    except OSError:
+        return node, subdirs
+    with it:
+        for entry in it:
+            try:
+                if entry.is_dir():
+                    # like os.walk: symlinked directories are not entered (except
+                    # at the top level, where the folder code used os.path.isdir)
+                    if follow_links or not entry.is_symlink():
+                        subdirs.append(entry.path)
+                    continue
+                if not entry.is_file() or (want is not None and not want(entry.name)):
+                    continue
+                meta = None
+                if with_stat:
+                    st = entry.stat()
+                    meta = (st.st_size, st.st_mtime_ns)
+                node.files[entry.name] = meta
+            except OSError:
+                continue
+    return node, sorted(subdirs)
+
+
+def scan_tree(path: str, max_depth: int, want=None, with_stat: bool = False) -> DirNode:
+    """Scan path and its sub-directories down to max_depth levels. Only files
+    accepted by want(name) (all when None) are recorded; with_stat adds their
+    size and mtime. Unreadable directories are left empty."""
+    node, subdirs = _read_dir(path, want, with_stat)
+    if max_depth > 0:
+        for sub in subdirs:
+            node.dirs[os.path.basename(sub)] = scan_tree(sub, max_depth - 1, want, with_stat)
+    return node
+
+
+def scan_folder(path: str, max_depth: int, want=None, with_stat: bool = False, workers: int = None):
+    """scan_tree with the top-level sub-directories scanned in parallel.
+
+    Returns (root DirNode, report); report holds Dirs, Files (recorded),
+    Seconds and Workers.
+    """
+    start = time.monotonic()
+    workers = workers or scan_workers()
+    root, tops = _read_dir(path, want, with_stat, follow_links=True)
+    if max_depth > 0 and tops:
+        with ThreadPoolExecutor(max_workers=min(workers, len(tops))) as pool:
+            nodes = pool.map(lambda sub: scan_tree(sub, max_depth - 1, want, with_stat), tops)
+            root.dirs = {os.path.basename(sub): node for sub, node in zip(tops, nodes)}
+    dirs, files = root.count()
+    report = {'Dirs': dirs, 'Files': files, 'Seconds': time.monotonic() - start, 'Workers': workers}
+    return root, report
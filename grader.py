@@ -0,0 +1,1032 @@
+import asyncio
+import contextlib
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import queue
+import shlex
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+
+import checker
+import compile_cache
+import config
+import limiter
+import sandbox
+import staging
+import test_archive
+import test_manifest
+from runner import KEEP_BYTES, borderline_margin, output_limit_bytes, run_program, run_program_async, wall_time_factor
+from test_manifest import find_test_io
+
+DATA_DIR = Path(__file__).resolve().parent / 'data'
+
+
+def load_data():
+    """Read (students, answers) from data/students_submissions.json and
+    data/answers_settings.json; missing or broken files give empty data.
+    """
+    try:
+        with open(DATA_DIR / 'answers_settings.json', 'r', encoding='utf-8') as f:
+            answers = json.load(f)
+    except Exception:
+        answers = {}
+    try:
+        with open(DATA_DIR / 'students_submissions.json', 'r', encoding='utf-8') as f:
+            students = json.load(f)
+    except Exception:
+        students = []
+    return students, answers
+
+
+def _cpu_cores() -> dict:
+    """{logical CPU: physical core key} from /proc/cpuinfo ({} when not readable)."""
+    cores = {}
+    try:
+        processor = phys_id = core_id = None
+        with open('/proc/cpuinfo', 'r', encoding='utf-8') as f:
+            for line in list(f) + ['']:
+                if line.startswith('processor'):
+                    processor = int(line.split(':', 1)[1])
+                elif line.startswith('physical id'):
+                    phys_id = line.split(':', 1)[1].strip()
+                elif line.startswith('core id'):
+                    core_id = line.split(':', 1)[1].strip()
+                elif not line.strip():
+                    if processor is not None:
+                        # without core ids every processor is its own core
+                        cores[processor] = (phys_id, core_id) if core_id is not None else ('cpu', processor)
+                    processor = phys_id = core_id = None
+    except (OSError, ValueError):
+        return {}
+    return cores
+
+
+def physical_core_cpus() -> list:
+    """One logical CPU per physical core (the lowest-numbered hyperthread
+    sibling), limited to the CPUs this process may run on. Empty when
+    /proc/cpuinfo is not readable.
+    """
+    first = {}
+    for cpu, key in _cpu_cores().items():
+        first[key] = min(cpu, first.get(key, cpu))
+    allowed = os.sched_getaffinity(0)
+    return sorted(cpu for cpu in first.values() if cpu in allowed)
+
+
+def physical_cores() -> int:
+    """Count physical CPU cores (hyperthread siblings counted once).
+    Falls back to os.cpu_count() when /proc/cpuinfo is not readable.
+    """
+    return len(physical_core_cpus()) or os.cpu_count() or 1
+
+
+def cpu_slots() -> list:
+    """CPUs the contestant programs are pinned to, one running test per CPU.
+
+    setting.GRADING_CPUS: None = one CPU per physical core but the last,
+    which is kept for the compilers (a single core is shared), a list of CPU
+    numbers = exactly those, [] = no pinning.
+    """
+    configured = config.get('GRADING_CPUS')
+    if configured is None:
+        cores = physical_core_cpus()
+        return cores[:-1] if len(cores) > 1 else cores
+    allowed = os.sched_getaffinity(0)
+    return [int(c) for c in configured if int(c) in allowed]
+
+
+def compile_cpus(slots: list) -> list:
+    """CPUs the compile pool may use while tests run: the ones this process
+    may run on, minus the slots and their hyperthread siblings. Empty when
+    every core holds a slot: the compilers are then not pinned."""
+    cores = _cpu_cores()
+    busy = {cores.get(cpu, ('cpu', cpu)) for cpu in slots}
+    return sorted(cpu for cpu in os.sched_getaffinity(0) if cores.get(cpu, ('cpu', cpu)) not in busy)
+
+
+def _pin_thread(cpus):
+    # affinity is per thread on Linux, and inherited by the compilers it starts
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+
+
+def default_workers() -> int:
+    """Number of grading workers: setting.GRADING_WORKERS or physical cores."""
+    configured = config.get('GRADING_WORKERS', None, int)
+    if configured:
+        return max(1, configured)
+    return physical_cores()
+
+
+def memory_budget_mb():
+    """RAM (MB) the declared MemoryLimit of the running tests may add up to.
+
+    setting.MEMORY_BUDGET_MB: a number of MB, None = 80% of the memory
+    available when grading starts, 0 = no admission control (returns None).
+    """
+    configured = config.get('MEMORY_BUDGET_MB', None, int)
+    if configured is not None:
+        return configured or None
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 8 // 10 // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def default_memory_limit() -> int:
+    """MemoryLimit (MB) assumed for tests that declare none."""
+    try:
+        return int(config.get('default_setting', {})['ExamInfomation']['MemoryLimit'])
+    except (KeyError, TypeError, ValueError):
+        return 1024
+
+
+class RunQueue:
+    """Compiled tests waiting to run, with admission control on memory.
+
+    At most capacity tests run at once, and only while the sum of their
+    declared MemoryLimit fits budget_mb (None = no budget), so several
+    high-memory problems in parallel cannot push the machine into swap. When
+    the next test does not fit, a later one that does (a low-memory test)
+    takes the free slot instead; a test larger than the whole budget runs
+    once nothing else does. Waiting tests are kept in one heap per memory
+    limit, so picking costs one look per distinct limit. Used from the
+    grade_all event loop only.
+    """
+
+    def __init__(self, capacity: int, budget_mb=None):
+        self.capacity = max(1, capacity)
+        self.budget_mb = budget_mb
+        self.used_mb = 0
+        self.running = 0
+        self._default_mb = default_memory_limit()
+        self._waiting = {}
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return sum(len(h) for h in self._waiting.values())
+
+    def cost(self, job: dict) -> int:
+        return job['MemoryLimit'] if job['MemoryLimit'] is not None else self._default_mb
+
+    def push(self, job: dict, key=0):
+        """Queue a test; among the tests that fit, the lowest key runs first,
+        then the earliest pushed."""
+        heapq.heappush(self._waiting.setdefault(self.cost(job), []), (key, next(self._seq), job))
+
+    def _fits(self, mb: int) -> bool:
+        return self.budget_mb is None or self.running == 0 or self.used_mb + mb <= self.budget_mb
+
+    def pop(self):
+        """Admit and return the next test that may start now, or None."""
+        if self.running >= self.capacity:
+            return None
+        best = None
+        for mb, heap in self._waiting.items():
+            if heap and self._fits(mb) and (best is None or heap[0][:2] < self._waiting[best][0][:2]):
+                best = mb
+        if best is None:
+            return None
+        job = heapq.heappop(self._waiting[best])[2]
+        self.used_mb += best
+        self.running += 1
+        return job
+
+    def release(self, job: dict):
+        """A test admitted by pop() has finished."""
+        self.used_mb -= self.cost(job)
+        self.running -= 1
+
+
+def find_submission(bai_lam: dict, prob_name: str):
+    """Return the student's submission path for prob_name, or None."""
+    for fname, fpath in bai_lam.items():
+        if prob_name.upper() in fname.upper() or os.path.splitext(fname)[0].upper() == prob_name.upper():
+            return fpath
+    return None
+
+
+def prepare_command(sub_path: str, timeout: int = 20):
+    """Build the command line used to run a submission, compiling C++ first
+    through compile_cache. Returns (cmd, compile_error); cmd is None when the
+    submission cannot be compiled.
+    """
+    sub_lower = sub_path.lower()
+
+    # programs run in a sandbox directory: the command must not depend on our cwd
+    sub_path = os.path.abspath(sub_path)
+    if sub_lower.endswith('.py'):
+        return f"{shlex.quote(sys.executable)} {shlex.quote(sub_path)}", b''
+    if sub_lower.endswith('.cpp'):
+        bin_path, stderr = compile_cache.compile_cpp(sub_path, timeout=timeout)
+        if bin_path:
+            return shlex.quote(bin_path), b''
+        return None, stderr or b'Compile error'
+    return shlex.quote(sub_path), b''
+
+
+def build_pairs(students: list, answers: dict):
+    """List the (student_idx, prob_name, sub_path) pairs that have a submission."""
+    pairs = []
+    for s_idx, student in enumerate(students):
+        bai_lam = student.get('BaiLam', {})
+        for prob_name, prob_def in answers.items():
+            # entries whose Settings.cfg failed to parse only carry an 'error'
+            if 'TestCases' not in prob_def:
+                continue
+            sub_path = find_submission(bai_lam, prob_name)
+            if sub_path:
+                pairs.append((s_idx, prob_name, sub_path))
+    return pairs
+
+
+def build_jobs(student: dict, s_idx: int, prob_name: str, prob_def: dict, sub_path: str, cmd: str = None):
+    """Expand one (student, problem) pair into per-test job dicts.
+    'Cmd' may be left None and filled in once the submission is compiled.
+    """
+    jobs = []
+    workdir = os.path.dirname(sub_path)
+    exam_info = prob_def.get('ExamInformation', {})
+    tl = int(exam_info.get('TimeLimit', 1))
+    evaluator = exam_info.get('EvaluatorName', '') or ''
+    # file-based I/O: the program reads InputFile / writes OutputFile in its working directory
+    use_stdin = _flag(exam_info.get('UseStdIn'))
+    use_stdout = _flag(exam_info.get('UseStdOut'))
+    input_file = os.path.basename(exam_info.get('InputFile') or f'{prob_name}.INP')
+    output_file = os.path.basename(exam_info.get('OutputFile') or f'{prob_name}.OUT')
+    for t_idx, tc in enumerate(prob_def.get('TestCases', [])):
+        try:
+            tc_mark = float(tc.get('Mark', 0))
+        except Exception:
+            tc_mark = 0.0
+        # determine memory limit per test (TestCase->ExamInformation->global default)
+        mem_mb = None
+        try:
+            mm = tc.get('MemoryLimit') or exam_info.get('MemoryLimit')
+            if mm is not None and str(mm) != "-1":
+                mem_mb = int(mm)
+        except Exception:
+            mem_mb = None
+        in_rec, exp_rec = test_manifest.lookup(prob_def, tc.get('Name'))
+        if in_rec:
+            input_path = in_rec['Path']
+            expected = exp_rec['Path'] if exp_rec else None
+        else:
+            input_path, expected = find_test_io(tc, workdir, prob_name, prob_def)
+        # expected output missing from the manifest / find_test_io; try some common fallbacks
+        if input_path and not expected:
+            expected_candidates = [input_path.replace('.INP', '.OUT'), input_path.replace('.inp', '.out'), os.path.join(workdir, tc.get('Name') + '.OUT')]
+            for ep in expected_candidates:
+                if os.path.exists(ep):
+                    expected = ep
+                    break
+        jobs.append({
+            'Student': s_idx,
+            'Name': student.get('Name'),
+            'Problem': prob_name,
+            'Index': t_idx,
+            'Test': tc.get('Name'),
+            'Cmd': cmd,
+            'Workdir': workdir,
+            'Input': input_path,
+            'Expected': expected,
+            'InputSha256': in_rec['Sha256'] if in_rec else None,
+            'ExpectedSha256': exp_rec['Sha256'] if exp_rec and exp_rec['Path'] == expected else None,
+            'TimeLimit': tl,
+            'MemoryLimit': mem_mb,
+            'Mark': tc_mark,
+            'Evaluator': evaluator,
+            'UseStdIn': use_stdin,
+            'UseStdOut': use_stdout,
+            'InputFile': input_file,
+            'OutputFile': output_file,
+        })
+    return jobs
+
+
+def _flag(value, default: bool = True) -> bool:
+    """Settings.cfg boolean ('true' / 'false'); missing means default."""
+    if value is None or str(value).strip() == '':
+        return default
+    return str(value).strip().lower() not in ('false', '0', 'no')
+
+
+def file_digest(path: str, cache: dict = None) -> str:
+    """sha256 of a file's bytes ('' when missing), memoized in cache if given."""
+    if not path:
+        return ''
+    if cache is not None and path in cache:
+        return cache[path]
+    h = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+    except OSError:
+        digest = ''
+    if cache is not None:
+        cache[path] = digest
+    return digest
+
+
+def toolchain_version(sub_path: str) -> str:
+    """Version string of whatever builds/runs this submission."""
+    sub_lower = sub_path.lower()
+    if sub_lower.endswith('.cpp'):
+        return compile_cache.compiler_version()
+    if sub_lower.endswith('.py'):
+        return sys.version
+    return ''
+
+
+def fingerprint(job: dict, sub_digest: str, toolchain: str, digests: dict = None) -> str:
+    """Identify everything a test verdict depends on: submission, test input
+    and expected output, resolved limits and timing policy, evaluator,
+    limiter backend, I/O mode and toolchain.
+    """
+    parts = [
+        sub_digest,
+        job['Test'] or '',
+        job.get('InputSha256') or file_digest(job['Input'], digests),
+        job.get('ExpectedSha256') or file_digest(job['Expected'], digests),
+        str(job['TimeLimit']),
+        f"cpu-time/wall-x{wall_time_factor()}",
+        str(job['MemoryLimit']),
+        job['Evaluator'],
+        checker.get_evaluator(job['Evaluator']).signature(),
+        limiter.default_limiter().name,
+        _io_mode(job),
+        toolchain,
+    ]
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _io_mode(job: dict) -> str:
+    return '/'.join(['stdin' if job['UseStdIn'] else job['InputFile'],
+                     'stdout' if job['UseStdOut'] else job['OutputFile']])
+
+
+def is_borderline(cpu_time: float, time_limit, wall_timed_out: bool = False) -> bool:
+    """True when cpu_time is within BORDERLINE_MARGIN (a fraction of the
+    limit) on either side of time_limit, or when the run was cut by the wall
+    clock before using its CPU budget (a busy machine, not a slow program)."""
+    try:
+        tl = float(time_limit)
+    except (TypeError, ValueError):
+        return False
+    if tl <= 0:
+        return False
+    if wall_timed_out and cpu_time < tl:
+        return True
+    return abs(cpu_time - tl) <= borderline_margin() * tl
+
+
+def grade_test(job: dict, cpu: int = None):
+    """Run one (student, problem, test) job and return its TestResults entry
+    together with the (bounded) stdout, stderr bytes for display.
+
+    The comparison follows the problem's EvaluatorName (checker.get_evaluator).
+    Streaming evaluators compare stdout while the program runs, so a wrong
+    answer is stopped at its first wrong line or token. The entry carries a
+    Verdict: AC, WA, TLE, MLE (cgroup limiter only), RE, OLE (output limit)
+    or IE (test files missing),
+    and the measured CpuTime, WallTime (seconds) and PeakRssKB of the run;
+    Leaked lists processes the submission left behind, if any.
+
+    TLE is judged on CPU time against TimeLimit; WallTimedOut marks runs
+    stopped by the wall-clock safety net instead, and Borderline the runs
+    whose verdict could flip with timing noise (see is_borderline).
+
+    With cpu given the program is pinned to that CPU, recorded as Cpu.
+
+    The program runs in an empty sandbox directory (see sandbox.py). When
+    UseStdIn is false the input is copied there as InputFile (stdin is
+    empty), and when UseStdOut is false the OutputFile it leaves there is
+    judged instead of stdout. Tests shipped in archives are read from their
+    extracted copy (test_archive.extracted).
+    """
+    with _local_files(job) as job:
+        if not job['Input']:
+            return _test_entry(job, cpu, None, None, None)
+        ev, stream, kwargs = _run_args(job, cpu)
+        with sandbox.default_pool().slot() as box:
+            stdin = _stage(job, box)
+            res = run_program(job['Cmd'], stdin, job['TimeLimit'], cwd=box, **kwargs)
+            _collect(job, box, res)
+        return _test_entry(job, cpu, res, ev, stream)
+
+
+async def grade_test_async(job: dict, cpu: int = None):
+    """grade_test for an asyncio event loop (runner.run_program_async).
+
+    The file work around the run (archive extraction, staging the input,
+    reading the expected output and OutputFile, emptying the sandbox) goes to
+    the loop's default executor, so a large test pack does not hold up the
+    other programs the loop is timing.
+    """
+    loop = asyncio.get_running_loop()
+    local = _local_files(job)
+    job = await loop.run_in_executor(None, local.__enter__)
+    try:
+        if not job['Input']:
+            return _test_entry(job, cpu, None, None, None)
+        ev, stream, kwargs = await loop.run_in_executor(None, _run_args, job, cpu)
+        pool = sandbox.default_pool()
+        box = await loop.run_in_executor(None, pool.acquire)
+        try:
+            stdin = await loop.run_in_executor(None, _stage, job, box)
+            res = await run_program_async(job['Cmd'], stdin, job['TimeLimit'], cwd=box, **kwargs)
+            await loop.run_in_executor(None, _collect, job, box, res)
+        finally:
+            await loop.run_in_executor(None, pool.release, box)
+        return await loop.run_in_executor(None, _test_entry, job, cpu, res, ev, stream)
+    finally:
+        local.__exit__(None, None, None)
+
+
+@contextlib.contextmanager
+def _local_files(job: dict):
+    """job with Input / Expected replaced by local files while in use: archive
+    members are extracted (None when that fails), plain paths kept."""
+    if not (test_archive.is_member(job['Input']) or test_archive.is_member(job['Expected'])):
+        yield job
+        return
+    with test_archive.extracted(job['Input'], job.get('InputSha256')) as input_path, \
+            test_archive.extracted(job['Expected'], job.get('ExpectedSha256')) as expected:
+        yield dict(job, Input=input_path, Expected=expected)
+
+
+def _stage(job: dict, box: str):
+    """Prepare box for a run; returns the file to feed on stdin (None: nothing).
+    The input is read from its staged copy (see staging.py), not the answers folder."""
+    staged = staging.input_path(job['Input'], job.get('InputSha256'))
+    if job['UseStdIn']:
+        return staged
+    sandbox.stage_input(box, staged, job['InputFile'])
+    return None
+
+
+def _collect(job: dict, box: str, res: dict):
+    """Read back the OutputFile of a file-output run into res['FileOutput']."""
+    if job['UseStdOut'] or res['Ret'] in (-2, -3):
+        return
+    limit = output_limit_bytes()
+    data = sandbox.read_output(box, job['OutputFile'], limit)
+    if data is not None and len(data) > limit:
+        res['OutputExceeded'] = True
+        data = data[:limit]
+    res['FileOutput'] = data
+
+
+def _run_args(job: dict, cpu: int = None):
+    """(evaluator, stream checker, run_program keyword arguments) of a job."""
+    ev = checker.get_evaluator(job['Evaluator'])
+    stream = None
+    keep = KEEP_BYTES
+    if job['Expected'] and job['UseStdOut']:
+        stream = ev.stream_checker(job['Expected'], job.get('ExpectedSha256'))
+        if stream is None:
+            # whole-output evaluator: keep stdout up to the output limit
+            keep = output_limit_bytes()
+    kwargs = {'memory_mb': job['MemoryLimit'], 'stream_checker': stream, 'keep_bytes': keep,
+              'cpus': None if cpu is None else [cpu]}
+    return ev, stream, kwargs
+
+
+def _test_failed(job: dict, error: Exception, cpu=None):
+    """(tr, stdout, stderr) of a test whose grading raised error: an IE entry
+    carrying the message in Error, which is also the stderr shown."""
+    tr, stdout, _ = _test_entry(job, cpu, None, None, None)
+    tr['Error'] = f'{type(error).__name__}: {error}'
+    return tr, stdout, tr['Error'].encode('utf-8', 'replace')
+
+
+def _test_entry(job: dict, cpu, res, ev, stream):
+    """Judge a run_program result (None: the test has no input) and build
+    the TestResults entry; returns (tr, stdout, stderr)."""
+    expected = job['Expected']
+    diff = None
+    usage = {'CpuTime': 0.0, 'WallTime': 0.0, 'PeakRssKB': 0}
+    leaked = []
+    wall_timed_out = False
+    if res is None:
+        verdict = 'IE'
+        ret = -9
+        stdout = b''
+        stderr = b''
+        timed_out = False
+    else:
+        ret, stdout, stderr, timed_out = res['Ret'], res['Stdout'], res['Stderr'], res['TimedOut']
+        usage = {k: res[k] for k in usage}
+        leaked = res['Leaked']
+        wall_timed_out = res['WallTimedOut']
+        answer = stdout if job['UseStdOut'] else res.get('FileOutput')
+        if expected and stream is None and not timed_out and not res['OutputExceeded'] and ret == 0:
+            if answer is None:
+                res['Accepted'], diff = False, {'MissingFile': job['OutputFile']}
+            else:
+                res['Accepted'], diff = ev.check(answer, expected, job.get('ExpectedSha256'))
+
+        if res['MemoryExceeded']:
+            verdict = 'MLE'
+        elif timed_out:
+            verdict = 'TLE'
+        elif res['OutputExceeded']:
+            verdict = 'OLE'
+        elif res['Mismatch']:
+            verdict = 'WA'
+        elif ret != 0:
+            verdict = 'RE'
+        elif not expected:
+            verdict = 'IE'
+        else:
+            verdict = 'AC' if res['Accepted'] else 'WA'
+        if stream is not None and verdict == 'WA':
+            diff = stream.diff
+        elif verdict != 'WA':
+            diff = None
+    passed = verdict == 'AC'
+
+    tr = {
+        'Test': job['Test'],
+        'Passed': bool(passed),
+        'Ret': int(ret) if isinstance(ret, int) else -1,
+        'TimedOut': bool(timed_out),
+        'Verdict': verdict,
+        'MarkEarned': float(job['Mark']) if passed else 0.0,
+        'CpuTime': round(usage['CpuTime'], 4),
+        'WallTime': round(usage['WallTime'], 4),
+        'PeakRssKB': usage['PeakRssKB'],
+    }
+    if cpu is not None:
+        tr['Cpu'] = cpu
+    if wall_timed_out:
+        tr['WallTimedOut'] = True
+    if is_borderline(usage['CpuTime'], job['TimeLimit'], wall_timed_out):
+        tr['Borderline'] = True
+    if diff:
+        tr['Diff'] = diff
+    if leaked:
+        tr['Leaked'] = leaked
+    if job.get('Fingerprint'):
+        tr['Fingerprint'] = job['Fingerprint']
+    # include truncated stdout/stderr
+    try:
+        tr['Stdout'] = stdout.decode('utf-8', errors='replace')[:2000]
+    except Exception:
+        tr['Stdout'] = ''
+    try:
+        tr['Stderr'] = stderr.decode('utf-8', errors='replace')[:2000]
+    except Exception:
+        tr['Stderr'] = ''
+    return tr, stdout, stderr
+
+
+def _record_pair(student: dict, answers: dict, prob_name: str, results: list, compile_error: bytes = None):
+    """Store the ordered test results of one (student, problem) pair and
+    update the raw-mark score in both the student and the answers index.
+    A compile error is kept under student['CompileErrors'][prob_name].
+    """
+    earned = sum(tr['MarkEarned'] for tr in results)
+    if results:
+        merged = student.get('TestResults')
+        merged = dict(merged) if isinstance(merged, dict) else {}
+        merged[prob_name] = results
+        # keep problems in answers order no matter which pair finished first
+        order = [p for p in answers if p in merged] + [p for p in merged if p not in answers]
+        student['TestResults'] = {p: merged[p] for p in order}
+
+    errors = student.get('CompileErrors')
+    errors = errors if isinstance(errors, dict) else {}
+    if compile_error is not None:
+        errors[prob_name] = compile_error.decode('utf-8', errors='replace')[:2000]
+        if isinstance(student.get('TestResults'), dict):
+            student['TestResults'].pop(prob_name, None)
+    else:
+        errors.pop(prob_name, None)
+    if errors:
+        student['CompileErrors'] = errors
+    else:
+        student.pop('CompileErrors', None)
+
+    scores = student.get('Scores', {})
+    scores[prob_name] = earned
+    student['Scores'] = scores
+
+    name = student.get('Name')
+    if prob_name in answers:
+        if 'Students' not in answers[prob_name] or not isinstance(answers[prob_name].get('Students'), dict):
+            answers[prob_name]['Students'] = {}
+        answers[prob_name]['Students'][name] = earned
+
+
+def rerun_count() -> int:
+    """setting.RERUN_COUNT: isolated re-runs of a TLE / borderline test (0 = off)."""
+    return max(0, config.get('RERUN_COUNT', 3, int))
+
+
+def needs_rerun(tr: dict) -> bool:
+    return tr.get('Verdict') == 'TLE' or bool(tr.get('Borderline'))
+
+
+def _timing(tr: dict) -> dict:
+    return {k: tr[k] for k in ('Verdict', 'CpuTime', 'WallTime', 'Cpu', 'WallTimedOut') if k in tr}
+
+
+def rerun_isolated(job: dict, first_tr: dict, runs: int, cpu: int = None):
+    """Run job again, alone, up to runs times and keep the best measurement.
+
+    The best run is the fastest one that was not cut by the wall clock. Its
+    entry becomes the result, with the parallel measurement in ParallelRun
+    and every re-run in Reruns. Re-running stops early once a run is a clear
+    TLE (well over the limit, or over the wall ceiling on a quiet CPU).
+    Returns (tr, stdout, stderr) like grade_test.
+    """
+    best = None
+    measurements = []
+    for _ in range(runs):
+        try:
+            tr, stdout, stderr = grade_test(job, cpu)
+        except Exception as e:
+            tr, stdout, stderr = _test_failed(job, e, cpu)
+        measurements.append(_timing(tr))
+        if best is None or (tr.get('WallTimedOut', False), tr['CpuTime']) < \
+                (best[0].get('WallTimedOut', False), best[0]['CpuTime']):
+            best = (tr, stdout, stderr)
+        if tr['Verdict'] == 'TLE' and (tr.get('WallTimedOut') or not tr.get('Borderline')):
+            break
+    tr = dict(best[0])
+    tr['ParallelRun'] = _timing(first_tr)
+    tr['Reruns'] = measurements
+    return tr, best[1], best[2]
+
+
+SCHEDULE_POLICIES = ('file', 'breadth', 'shortest', 'slowest')
+
+
+def schedule_policy() -> str:
+    """setting.SCHEDULE_POLICY, the order in which compiled tests are run:
+
+    - 'file': pair by pair, in the order of the student list;
+    - 'breadth': test 1 of every pair first, then test 2, ... so every
+      student has a comparable partial score early;
+    - 'shortest': shortest expected run first (most results per minute);
+    - 'slowest': longest expected run first (shorter tail at the end).
+    """
+    return config.get('SCHEDULE_POLICY') or 'file'
+
+
+def expected_time(job: dict, history: dict) -> float:
+    """Expected CPU time of a job: its own last run, else the median of the
+    stored runs of the same test by other students, else its TimeLimit."""
+    if job.get('LastCpuTime') is not None:
+        return job['LastCpuTime']
+    times = history.get((job['Problem'], job['Test']))
+    if times:
+        return statistics.median(times)
+    return float(job['TimeLimit'])
+
+
+def schedule_key(policy: str, job: dict, history: dict):
+    """RunQueue key of a job under policy (lower runs first)."""
+    if policy == 'breadth':
+        return job['Index']
+    if policy == 'shortest':
+        return expected_time(job, history)
+    if policy == 'slowest':
+        return -expected_time(job, history)
+    return 0
+
+
+def scoreboard_interval() -> float:
+    """setting.SCOREBOARD_INTERVAL: seconds between two partial scoreboards."""
+    return config.get('SCOREBOARD_INTERVAL', 5.0, float)
+
+
+def scoreboard(students: list, answers: dict, in_progress: dict) -> list:
+    """Ranking from the recorded scores plus the finished tests of the pairs
+    still being graded (in_progress: (s_idx, prob_name) -> results in test
+    order, None for tests not graded yet).
+
+    Returns one row per student, best first: Name, Total, Scores (per
+    problem, partial for the pairs in progress) and Pending (tests not
+    graded yet).
+    """
+    rows = []
+    for s_idx, student in enumerate(students):
+        scores = {}
+        pending = 0
+        for prob_name in answers:
+            results = in_progress.get((s_idx, prob_name))
+            if results is not None:
+                scores[prob_name] = sum(tr['MarkEarned'] for tr in results if tr is not None)
+                pending += sum(1 for tr in results if tr is None)
+            elif prob_name in (student.get('Scores') or {}):
+                scores[prob_name] = student['Scores'][prob_name]
+        total = sum(max(float(v), 0.0) for v in scores.values())
+        rows.append({'Name': student.get('Name'), 'Total': total, 'Scores': scores, 'Pending': pending})
+    rows.sort(key=lambda r: -r['Total'])
+    return rows
+
+
+def test_runner() -> str:
+    """setting.TEST_RUNNER: 'threads' (one thread per running test) or 'asyncio'."""
+    return config.get('TEST_RUNNER') or 'threads'
+
+
+class AsyncTestPool:
+    """Run pool of grade_all on one asyncio event loop (TEST_RUNNER = 'asyncio').
+
+    Tests are grade_test_async coroutines on a loop running in a background
+    thread: at most `concurrency` of them are in flight and, like the thread
+    pool, each holds one CPU of slots while it runs. submit() returns a
+    concurrent.futures.Future, so results go through the same event queue.
+    Leaving the with-block on an exception cancels the tests still running.
+    """
+
+    def __init__(self, concurrency: int, slots: list):
+        self.slots = list(slots)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='test-runner', daemon=True)
+        self.thread.start()
+        self._futures = set()
+        self._sem, self._cpus = asyncio.run_coroutine_threadsafe(self._setup(concurrency), self.loop).result()
+
+    async def _setup(self, concurrency):
+        # created on the loop's own thread
+        cpus = asyncio.Queue()
+        for cpu in self.slots:
+            cpus.put_nowait(cpu)
+        return asyncio.Semaphore(max(1, concurrency)), cpus
+
+    async def _run(self, job):
+        async with self._sem:
+            if not self.slots:
+                return await grade_test_async(job)
+            cpu = await self._cpus.get()
+            try:
+                return await grade_test_async(job, cpu)
+            finally:
+                self._cpus.put_nowait(cpu)
+
+    def add_cpu(self, cpu: int):
+        """One more CPU for the tests (callable from any thread)."""
+        self.loop.call_soon_threadsafe(self._cpus.put_nowait, cpu)
+
+    def submit(self, job):
+        fut = asyncio.run_coroutine_threadsafe(self._run(job), self.loop)
+        self._futures.add(fut)
+        fut.add_done_callback(self._futures.discard)
+        return fut
+
+    def close(self, cancel: bool = False):
+        """Wait for the submitted tests (cancel them with cancel=True), then stop the loop."""
+        if cancel:
+            for fut in list(self._futures):
+                fut.cancel()
+        else:
+            wait(list(self._futures))
+        asyncio.run_coroutine_threadsafe(self._settle_tasks(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def _settle_tasks(self):
+        # cancelled tests still kill and reap their programs
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(cancel=exc_type is not None)
+
+
+def grade_all(students: list, answers: dict, workers: int = None, on_result=None, on_pair_done=None,
+              previous=None, force: bool = False, runner: str = None, policy: str = None, on_scores=None):
+    """Grade every student against every problem: a compile pool builds the
+    submissions while a run pool runs the tests of those already compiled.
+
+    previous(student_name, prob_name) returns the stored TestResults of a
+    pair; tests whose fingerprint() is unchanged are reused (force=True
+    regrades everything). runner and policy default to setting.TEST_RUNNER
+    and setting.SCHEDULE_POLICY. on_result(job, tr, stdout, stderr, done,
+    total) is called after each test, on_pair_done(student, prob_name) once a
+    pair is recorded and on_scores(rows) with a partial scoreboard() while
+    tests run; all from the calling thread.
+    Returns a dict with the number of tests run, reused and re-run and of
+    compile errors.
+    """
+    workers = workers or default_workers()
+    policy = policy or schedule_policy()
+    if policy not in SCHEDULE_POLICIES:
+        raise ValueError(f"unknown schedule policy: {policy}")
+    # binaries stay cached until their tests (and re-runs) are done
+    with compile_cache.session():
+        return _grade_all(students, answers, workers, on_result, on_pair_done, previous, force,
+                          runner, policy, on_scores)
+
+
+def _grade_all(students, answers, workers, on_result, on_pair_done, previous, force, runner, policy, on_scores):
+    reruns = rerun_count()
+    slots = cpu_slots()
+    free_cpus = queue.Queue()
+    for cpu in slots:
+        free_cpus.put(cpu)
+
+    def run_pinned(job):
+        if not slots:
+            return grade_test(job)
+        cpu = free_cpus.get()
+        try:
+            return grade_test(job, cpu)
+        finally:
+            free_cpus.put(cpu)
+
+    if (runner or test_runner()) == 'asyncio':
+        run_pool = AsyncTestPool(workers, slots)
+        submit_test = run_pool.submit
+        add_cpu = run_pool.add_cpu
+    else:
+        run_pool = ThreadPoolExecutor(max_workers=workers)
+        add_cpu = free_cpus.put
+
+        def submit_test(job):
+            return run_pool.submit(run_pinned, job)
+
+    run_queue = RunQueue(min(workers, len(slots)) if slots else workers, memory_budget_mb())
+
+    def start_tests() -> int:
+        started = 0
+        while True:
+            job = run_queue.pop()
+            if job is None:
+                return started
+            run_fut = submit_test(job)
+            run_fut.add_done_callback(lambda f, job=job: events.put(('tested', job, f)))
+            started += 1
+
+    # compilers must not share a core with timed runs: they get the cores
+    # without a slot (unpinned when there are none) and build while tests run
+    build_cpus = compile_cpus(slots) if slots else []
+    # the core cpu_slots() kept for compiling runs tests once all is built
+    spare = [c for c in physical_core_cpus() if c in build_cpus] if config.get('GRADING_CPUS') is None else []
+    compiling = 0
+
+    def release_compile_cores():
+        for cpu in spare:
+            if run_queue.capacity < workers:
+                add_cpu(cpu)
+                run_queue.capacity += 1
+        spare.clear()
+
+    pairs = build_pairs(students, answers)
+    events = queue.Queue()
+    digests = {}
+    stats = {'Run': 0, 'Reused': 0, 'Rerun': 0, 'CompileErrors': 0}
+
+    history = {}
+    collected = {}
+    ran = {}
+    deferred = []
+    remaining = {}
+    waiting = {}
+    total = 0
+    done = 0
+    pending = 0
+
+    def finish_pair(s_idx, prob_name, results, compile_error=None):
+        _record_pair(students[s_idx], answers, prob_name, results, compile_error)
+        if on_pair_done:
+            on_pair_done(students[s_idx], prob_name)
+
+    interval = scoreboard_interval()
+    last_board = time.monotonic()
+
+    def publish_scores():
+        in_progress = dict(collected)
+        in_progress.update((key, results) for key, results, _ in deferred)
+        on_scores(scoreboard(students, answers, in_progress))
+
+    compile_pool = ThreadPoolExecutor(max_workers=workers, initializer=_pin_thread, initargs=(build_cpus,))
+    with compile_pool, run_pool:
+        for pair in pairs:
+            s_idx, prob_name, sub_path = pair
+            student = students[s_idx]
+            jobs = build_jobs(student, s_idx, prob_name, answers[prob_name], sub_path)
+            if not jobs:
+                finish_pair(s_idx, prob_name, [])
+                continue
+
+            sub_digest = file_digest(sub_path)
+            toolchain = toolchain_version(sub_path)
+            stored = [] if previous is None else (previous(student.get('Name'), prob_name) or [])
+            results = [None] * len(jobs)
+            todo = []
+            for job in jobs:
+                job['Fingerprint'] = fingerprint(job, sub_digest, toolchain, digests)
+                old = stored[job['Index']] if job['Index'] < len(stored) else None
+                if old and old.get('CpuTime') is not None:
+                    # stored timings feed the shortest / slowest policies, even with force
+                    job['LastCpuTime'] = old['CpuTime']
+                    history.setdefault((prob_name, job['Test']), []).append(old['CpuTime'])
+                if not force and old and old.get('Fingerprint') == job['Fingerprint']:
+                    # the verdict still holds, but the test's Mark may have changed
+                    results[job['Index']] = dict(old, MarkEarned=job['Mark'] if old.get('Passed') else 0.0)
+                else:
+                    todo.append(job)
+            stats['Reused'] += len(jobs) - len(todo)
+            if not todo:
+                finish_pair(s_idx, prob_name, results)
+                continue
+
+            collected[(s_idx, prob_name)] = results
+            remaining[(s_idx, prob_name)] = len(todo)
+            waiting[(s_idx, prob_name)] = todo
+            total += len(todo)
+            fut = compile_pool.submit(prepare_command, sub_path)
+            fut.add_done_callback(lambda f, pair=pair: events.put(('compiled', pair, f)))
+            pending += 1
+            compiling += 1
+        if not compiling:
+            release_compile_cores()
+
+        while pending:
+            kind, item, fut = events.get()
+            pending -= 1
+            if kind == 'compiled':
+                compiling -= 1
+                s_idx, prob_name, sub_path = item
+                key = (s_idx, prob_name)
+                jobs = waiting.pop(key)
+                try:
+                    cmd, compile_error = fut.result()
+                except Exception as e:
+                    # one broken submission must not stop the others
+                    cmd, compile_error = None, f'{type(e).__name__}: {e}'.encode('utf-8', 'replace')
+                if not cmd:
+                    total -= len(jobs)
+                    collected.pop(key)
+                    stats['CompileErrors'] += 1
+                    finish_pair(s_idx, prob_name, [], compile_error)
+                else:
+                    for job in jobs:
+                        job['Cmd'] = cmd
+                        run_queue.push(job, schedule_key(policy, job, history))
+                if not compiling:
+                    release_compile_cores()
+                pending += start_tests()
+            else:
+                job = item
+                run_queue.release(job)
+                pending += start_tests()
+                try:
+                    tr, stdout, stderr = fut.result()
+                except Exception as e:
+                    tr, stdout, stderr = _test_failed(job, e)
+                key = (job['Student'], job['Problem'])
+                collected[key][job['Index']] = tr
+                ran.setdefault(key, []).append(job)
+                remaining[key] -= 1
+                done += 1
+                if on_result:
+                    on_result(job, tr, stdout, stderr, done, total)
+                if on_scores and time.monotonic() - last_board >= interval:
+                    publish_scores()
+                    last_board = time.monotonic()
+                if remaining[key] == 0:
+                    results = collected.pop(key)
+                    jobs = ran.pop(key)
+                    if reruns and any(needs_rerun(results[j['Index']]) for j in jobs):
+                        deferred.append((key, results, jobs))
+                    else:
+                        finish_pair(job['Student'], job['Problem'], results)
+
+    # isolated pass: nothing else is running now, the first slot is quiet
+    quiet_cpu = slots[0] if slots else None
+    for (s_idx, prob_name), results, jobs in deferred:
+        for job in sorted(jobs, key=lambda j: j['Index']):
+            first = results[job['Index']]
+            if needs_rerun(first):
+                results[job['Index']], _, _ = rerun_isolated(job, first, reruns, quiet_cpu)
+                stats['Rerun'] += 1
+        finish_pair(s_idx, prob_name, results)
+    deferred.clear()
+    if on_scores:
+        publish_scores()
+
+    stats['Run'] = done
+    return stats
@@ -0,0 +1,276 @@
+"""Resource limits for one test run.
+
+Backends (setting.LIMITER_BACKEND):
+
+- 'rlimit': RLIMIT_AS, RLIMIT_CPU, RLIMIT_FSIZE and (optionally) RLIMIT_NPROC
+  and the CPU affinity are set in the child between fork and exec, so they
+  hold from the first instruction of the program: a static array larger
+  than MemoryLimit fails at exec. With setting.RLIMIT_BEFORE_EXEC = False
+  they are set with prlimit(2) once the child is started instead, which
+  keeps subprocess on its vfork fast path but lets memory mapped at exec
+  (static arrays) and threads started before the call escape the limits
+  ('prlimit', the old external wrapper, is accepted as an alias);
+- 'cgroup': every run gets its own cgroup v2 leaf under setting.CGROUP_ROOT.
+  memory.max limits the resident memory (large virtual reservations are
+  fine), memory.peak / cpu.stat give the exact peak memory and CPU time of the
+  whole process tree and memory.events tells an OOM kill (MLE) apart from a
+  crash. The child joins its leaf between fork and exec, so memory mapped at
+  exec is charged and limited too. The CPU limit is still an rlimit. When
+  the cgroup root is not usable the 'rlimit' backend is used instead.
+
+The root must be a cgroup v2 directory delegated to the grading user, with
+the memory controller available (e.g. `systemd-run --user -p Delegate=yes`).
+"""
+import itertools
+import math
+import os
+import resource
+import threading
+import time
+
+import config
+
+_counter = itertools.count()
+_lock = threading.Lock()
+_default = None
+
+
+class RunLimits:
+    """Limits of one run. The base class applies nothing.
+
+    run_program passes preexec (the setup run in the child before exec, or
+    None) to Popen, then calls spawned(pid) once the child exists, finish()
+    after it was reaped (the returned dict overrides the measured CpuTime /
+    PeakRssKB and may set MemoryExceeded) and finally cleanup().
+    """
+    preexec = None
+
+    def spawned(self, pid: int):
+        pass
+
+    def finish(self) -> dict:
+        return {}
+
+    def cleanup(self):
+        pass
+
+
+class _RlimitRun(RunLimits):
+
+    def __init__(self, memory_mb, cpu_sec, cpus=None, before_exec: bool = True):
+        self.cpus = cpus
+        # run_program stops the program once it passes cpu_sec; the rlimit is
+        # only a backstop for what its sampling can miss
+        cpu = math.ceil(cpu_sec) + 1
+        # one byte over the output limit, so a program writing too much leaves
+        # a file that is judged OLE instead of dying of SIGXFSZ (RE)
+        fsize = _output_limit() + 1
+        self.limits = [(resource.RLIMIT_CPU, (cpu, cpu + 1)), (resource.RLIMIT_FSIZE, (fsize, fsize))]
+        if memory_mb is not None:
+            as_bytes = int(memory_mb) * 1024 * 1024
+            self.limits.append((resource.RLIMIT_AS, (as_bytes, as_bytes)))
+        nproc = config.get('MAX_PROCESSES', None, int)
+        if nproc is not None:
+            self.limits.append((resource.RLIMIT_NPROC, (nproc, nproc)))
+        self.before_exec = before_exec
+        if before_exec:
+            self.preexec = self._apply_in_child
+
+    def _apply_in_child(self):
+        # runs in the child between fork and exec: no allocation-heavy work here
+        if self.cpus:
+            os.sched_setaffinity(0, self.cpus)
+        for res, value in self.limits:
+            resource.setrlimit(res, value)
+
+    def spawned(self, pid: int):
+        if self.before_exec:
+            return
+        try:
+            if self.cpus:
+                os.sched_setaffinity(pid, self.cpus)
+            for res, value in self.limits:
+                resource.prlimit(pid, res, value)
+        except ProcessLookupError:
+            # already exited
+            pass
+
+
+class _CgroupRun(_RlimitRun):
+
+    def __init__(self, root: str, memory_mb, cpu_sec, cpus=None, before_exec: bool = True):
+        # memory is limited by the cgroup, CPU time still by an rlimit
+        super().__init__(None, cpu_sec, cpus, before_exec)
+        # the child always joins the leaf before exec, whatever before_exec
+        # says of the rlimits: pages mapped at exec are charged to it too
+        self.preexec = self._apply_in_child
+        self.path = os.path.join(root, f'run-{os.getpid()}-{next(_counter)}')
+        os.mkdir(self.path)
+        self.procs_fd = None
+        try:
+            _write(self.path, 'memory.max', str(int(memory_mb) * 1024 * 1024))
+            try:
+                _write(self.path, 'memory.swap.max', '0')
+            except OSError:
+                pass
+            self.procs_fd = os.open(os.path.join(self.path, 'cgroup.procs'), os.O_WRONLY)
+        except Exception:
+            self.cleanup()
+            raise
+
+    def _apply_in_child(self):
+        os.write(self.procs_fd, b'0')
+        if self.before_exec:
+            super()._apply_in_child()
+
+    def spawned(self, pid: int):
+        os.close(self.procs_fd)
+        self.procs_fd = None
+        super().spawned(pid)
+
+    def finish(self):
+        stats = {}
+        peak = _read(self.path, 'memory.peak')
+        if peak:
+            stats['PeakRssKB'] = int(peak) // 1024
+        usage = _read_keyed(self.path, 'cpu.stat').get('usage_usec')
+        if usage is not None:
+            stats['CpuTime'] = usage / 1e6
+        if _read_keyed(self.path, 'memory.events').get('oom_kill', 0) > 0:
+            stats['MemoryExceeded'] = True
+        return stats
+
+    def cleanup(self):
+        if self.procs_fd is not None:
+            os.close(self.procs_fd)
+            self.procs_fd = None
+        # forked leftovers keep the leaf busy: kill them before removing it
+        try:
+            _write(self.path, 'cgroup.kill', '1')
+        except OSError:
+            pass
+        for _ in range(50):
+            try:
+                os.rmdir(self.path)
+                return
+            except FileNotFoundError:
+                return
+            except OSError:
+                time.sleep(0.01)
+
+
+def _output_limit() -> int:
+    # files written by the program are capped like its stdout
+    return config.get('OUTPUT_LIMIT_MB', 64, int) * 1024 * 1024
+
+
+def _write(path: str, name: str, value: str):
+    with open(os.path.join(path, name), 'w') as f:
+        f.write(value)
+
+
+def _read(path: str, name: str):
+    try:
+        with open(os.path.join(path, name)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _read_keyed(path: str, name: str) -> dict:
+    """Parse a flat keyed cgroup file ("key value" per line)."""
+    out = {}
+    for line in (_read(path, name) or '').splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1].isdigit():
+            out[parts[0]] = int(parts[1])
+    return out
+
+
+class Limiter:
+    """Factory of RunLimits for one backend."""
+    name = 'none'
+    fallback_reason = None
+    before_exec = False
+
+    def start(self, memory_mb, cpu_sec, cpus=None) -> RunLimits:
+        return RunLimits()
+
+
+def _before_exec() -> bool:
+    return bool(config.get('RLIMIT_BEFORE_EXEC', True))
+
+
+class RlimitLimiter(Limiter):
+
+    def __init__(self, before_exec: bool = None):
+        self.before_exec = _before_exec() if before_exec is None else before_exec
+        # part of the test fingerprints: the two modes can judge static arrays differently
+        self.name = 'rlimit' if self.before_exec else 'rlimit-postexec'
+
+    def start(self, memory_mb, cpu_sec, cpus=None):
+        return _RlimitRun(memory_mb, cpu_sec, cpus, self.before_exec)
+
+
+class CgroupLimiter(Limiter):
+    name = 'cgroup'
+
+    def __init__(self, root: str, before_exec: bool = None):
+        self.root = root
+        self.before_exec = _before_exec() if before_exec is None else before_exec
+        problem = cgroup_problem(root)
+        if problem:
+            raise OSError(problem)
+
+    def start(self, memory_mb, cpu_sec, cpus=None):
+        if memory_mb is None:
+            return _RlimitRun(None, cpu_sec, cpus, self.before_exec)
+        return _CgroupRun(self.root, memory_mb, cpu_sec, cpus, self.before_exec)
+
+
+def cgroup_problem(root: str):
+    """Why root cannot hold per-run cgroup v2 leaves (None when it can).
+    Enables the memory controller for its children as a side effect."""
+    if not root:
+        return 'CGROUP_ROOT chưa được cấu hình'
+    if not os.path.isfile(os.path.join(root, 'cgroup.controllers')):
+        return f'{root} không phải cgroup v2'
+    if 'memory' not in (_read(root, 'cgroup.controllers') or '').split():
+        return f'{root}: không có memory controller'
+    if 'memory' not in (_read(root, 'cgroup.subtree_control') or '').split():
+        try:
+            _write(root, 'cgroup.subtree_control', '+memory')
+        except OSError as e:
+            return f'{root}: không bật được memory controller ({e})'
+    if not os.access(root, os.W_OK):
+        return f'{root}: không có quyền ghi'
+    return None
+
+
+def get_limiter(backend: str = None, cgroup_root: str = None) -> Limiter:
+    """Limiter for backend ('rlimit' or 'cgroup'; default
+    setting.LIMITER_BACKEND). A cgroup limiter that cannot be set up falls
+    back to rlimit, with the reason in fallback_reason."""
+    if backend is None:
+        backend = config.get('LIMITER_BACKEND', 'rlimit')
+    if backend == 'cgroup':
+        if cgroup_root is None:
+            cgroup_root = config.get('CGROUP_ROOT')
+        try:
+            return CgroupLimiter(cgroup_root)
+        except OSError as e:
+            lim = RlimitLimiter()
+            lim.fallback_reason = str(e)
+            return lim
+    if backend in ('rlimit', 'prlimit'):
+        return RlimitLimiter()
+    raise ValueError(f"unknown limiter backend: {backend}")
+
+
+def default_limiter() -> Limiter:
+    """Process-wide limiter built from the settings on first use."""
+    global _default
+    with _lock:
+        if _default is None:
+            _default = get_limiter()
+        return _default
@@ -8,21 +8,29 @@ from pathlib import Path
 from setting import MENU_MAIN,LOGO
 from setting import MENU_SETTING
 from ulti_tui import draw_logo, draw_title, draw_menu, get_input, get_text_input, is_valid_folder_path
+import config
+import folder_scan
 import problem_loader
-import subprocess
-import shlex
-import sys
+import grader
+import results_store
+import test_manifest
 import time
-import shutil
 
 file_path = {"Folder Answer": "","Folder Test": ""}
 
+# submission files of the last scan, compared by _merge_previous
+SNAPSHOT_PATH = Path(__file__).resolve().parent / 'data' / 'submissions_snapshot.json'
 
-def process_answer_folder(folder_path: str):
+
+def process_answer_folder(folder_path: str, report: dict = None):
     """Scan each immediate subfolder of folder_path, look for a Settings.cfg
     (in the first subfolder or directly inside the problem folder). Parse found
     Settings.cfg with problem_loader.load_cfg and save results to
-    <project>/answers_settings.json. Returns (out_path, results_dict).
+    <project>/answers_settings.json, together with a per-problem test
+    'Manifest' (input/expected paths, sizes, checksums; see test_manifest).
+    The folders are read in one parallel pass (folder_scan); its timing is
+    copied into report when given.
+    Returns (out_path, results_dict).
     """
     folder_path = os.path.expanduser(folder_path)
     data_dir = Path(__file__).resolve().parent / 'data'
@@ -33,24 +41,20 @@ def process_answer_folder(folder_path: str):
     if not os.path.isdir(folder_path):
         raise NotADirectoryError(folder_path)
 
-    for entry in sorted(os.listdir(folder_path)):
-        prob_path = os.path.join(folder_path, entry)
-        if not os.path.isdir(prob_path):
-            continue
+    scan, scan_report = folder_scan.scan_folder(folder_path, 2, want=lambda name: name == 'Settings.cfg')
+    if report is not None:
+        report.update(scan_report)
 
-        # candidate locations to look for Settings.cfg
-        candidates = []
-        # check directly inside problem folder first
-        candidates.append(os.path.join(prob_path, 'Settings.cfg'))
-        # also check any immediate child subfolder for Settings.cfg (not only first)
-        subdirs = [d for d in os.listdir(prob_path) if os.path.isdir(os.path.join(prob_path, d))]
-        for sd in sorted(subdirs):
-            candidates.append(os.path.join(prob_path, sd, 'Settings.cfg'))
+    for entry in sorted(scan.dirs):
+        prob_node = scan.dirs[entry]
+        prob_path = prob_node.path
 
+        # Settings.cfg directly inside the problem folder first, then in any
+        # immediate child subfolder (not only the first)
         found = None
-        for c in candidates:
-            if os.path.isfile(c):
-                found = c
+        for node, _ in prob_node.walk(1):
+            if 'Settings.cfg' in node.files:
+                found = os.path.join(node.path, 'Settings.cfg')
                 break
 
         if found:
@@ -114,11 +118,7 @@ def process_answer_folder(folder_path: str):
                 except Exception:
                     pass
                 # get global defaults from setting.py
-                try:
-                    import setting as _setting
-                    global_defaults = _setting.default_setting.get('ExamInfomation', {})
-                except Exception:
-                    global_defaults = {}
+                global_defaults = (config.get('default_setting') or {}).get('ExamInfomation', {})
 
                 # normalize exam-level defaults: if exam has -1 or missing, fill from global defaults
                 for ek in ('Mark', 'TimeLimit', 'MemoryLimit'):
@@ -152,6 +152,8 @@ def process_answer_folder(folder_path: str):
                     tc['MemoryLimit'] = eff_mem
 
                 data['TestCases'] = tests
+                # resolve test files once; grading reads paths and checksums from here
+                data['Manifest'] = test_manifest.build_manifest(prob_path, entry, tests)
                 results[entry] = data
         else:
             results[entry] = {"error": "Settings.cfg not found"}
@@ -162,7 +164,97 @@ def process_answer_folder(folder_path: str):
     return str(out), results
 
 
-def process_student_folder(folder_path: str):
+def scan_summary(report: dict) -> str:
+    """One line describing a folder_scan report."""
+    line = (f"Quét: {report.get('Dirs', 0)} thư mục, {report.get('Files', 0)} file"
+            f" trong {report.get('Seconds', 0.0):.2f}s ({report.get('Workers', 1)} luồng)")
+    if 'Added' in report:
+        line += f"  Bài mới: {report['Added']}, đã sửa: {report['Modified']}, đã xoá: {report['Removed']}"
+    return line
+
+
+def _snapshot_files(students: dict, meta: dict, old_files: dict) -> dict:
+    """{path: {'Size', 'Mtime', 'Sha256'}} of every submission file. Files
+    whose size and mtime match the previous snapshot keep its hash."""
+    files = {}
+    for s in students.values():
+        for path in s['BaiLam'].values():
+            size, mtime = meta.get(path) or (None, None)
+            prev = old_files.get(path)
+            if prev and prev['Size'] == size and prev['Mtime'] == mtime:
+                sha = prev['Sha256']
+            else:
+                sha = grader.file_digest(path)
+            files[path] = {'Size': size, 'Mtime': mtime, 'Sha256': sha}
+    return files
+
+
+def _merge_previous(students: dict, exams: dict, folder_path: str, meta: dict, old_students: list, report: dict = None):
+    """Compare a rescan with the snapshot of the previous one
+    (data/submissions_snapshot.json: path, size, mtime and sha256 of every
+    submission file) and carry over the results of untouched submissions.
+
+    A (student, problem) pair keeps its Scores, TestResults and CompileErrors
+    from old_students when its submission is the same file with the same
+    content; every other pair is left as scanned (0 / -1). The new snapshot is
+    written and the Added / Modified / Removed file counts go into report.
+    Returns the (student name, problem name) pairs whose stored results are
+    stale, or None when the previous scan was of another folder (nothing is
+    kept then).
+    """
+    try:
+        with open(SNAPSHOT_PATH, 'r', encoding='utf-8') as f:
+            old = json.load(f)
+    except Exception:
+        old = {}
+    root = os.path.abspath(folder_path)
+    same_root = old.get('Root') == root
+    old_files = (old.get('Files') or {}) if same_root else {}
+    files = _snapshot_files(students, meta, old_files)
+    if report is not None:
+        report['Added'] = sum(1 for p in files if p not in old_files)
+        report['Modified'] = sum(1 for p in files if p in old_files and files[p]['Sha256'] != old_files[p]['Sha256'])
+        report['Removed'] = sum(1 for p in old_files if p not in files)
+    with open(SNAPSHOT_PATH, 'w', encoding='utf-8') as f:
+        json.dump({'Root': root, 'Files': files}, f, ensure_ascii=False, indent=2)
+    if not same_root:
+        return None
+
+    previous = {s.get('Name'): s for s in old_students if isinstance(s, dict)}
+    stale = []
+    for name, s in students.items():
+        prev = previous.get(name)
+        for exam_name in exams:
+            path = grader.find_submission(s['BaiLam'], exam_name)
+            if prev is not None and path == grader.find_submission(prev.get('BaiLam') or {}, exam_name) and \
+                    (path is None or files[path]['Sha256'] == (old_files.get(path) or {}).get('Sha256')):
+                for key in ('Scores', 'TestResults', 'CompileErrors'):
+                    if exam_name in (prev.get(key) or {}):
+                        s.setdefault(key, {})[exam_name] = prev[key][exam_name]
+            else:
+                stale.append((name, exam_name))
+    return stale
+
+
+def _load_students(path) -> list:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, list) else []
+    except Exception:
+        return []
+
+
+def _reset_results(stale):
+    """Drop the stored results a rescan made stale (all of them when stale is None)."""
+    with results_store.open_store() as store:
+        if stale is None:
+            store.clear_results()
+        else:
+            store.clear_pairs(stale)
+
+
+def process_student_folder(folder_path: str, report: dict = None):
     """Scan a student submissions folder and produce students_submissions.json.
 
     Folder layout accepted:
@@ -172,6 +264,11 @@ def process_student_folder(folder_path: str):
 
     It will build a dict of students -> { 'Name': name, 'BaiLam': {problem_file: abs_path}, 'Scores': {problem_name: 0}}
     Then it will merge student names into answers_settings.json under each exam as 'Students': {student_name: 0}
+    Rescanning the same folder is incremental: only the pairs whose submission
+    was added, modified or removed are reset, the others keep their results
+    (see _merge_previous).
+    The folder is read in one parallel pass (folder_scan); its timing and
+    the file diff are copied into report when given.
     Returns (out_path, students_dict)
     """
     folder_path = os.path.expanduser(folder_path)
@@ -192,38 +289,35 @@ def process_student_folder(folder_path: str):
         except Exception:
             exams = {}
 
+    old_students = _load_students(out_students)
     students = {}
 
-    # detect if provided folder_path itself is a single student's folder
+    # one os.scandir per directory, down to the deepest level a layout looks
+    # at (problem/student/<two levels of subfolders>)
     code_exts = ('.cpp', '.py', '.pas', '.pascal')
-    def _contains_code(dirp: str) -> bool:
-        for root, dirs, files in os.walk(dirp):
-            rel = os.path.relpath(root, dirp)
-            if rel.count(os.sep) > 1:
-                continue
-            for f in files:
-                if f.lower().endswith(code_exts):
-                    return True
-        return False
-
-    if _contains_code(folder_path):
+
+    def _is_code(name: str) -> bool:
+        return name.lower().endswith(code_exts)
+
+    tree, scan_report = folder_scan.scan_folder(folder_path, 4, with_stat=True,
+                                                want=lambda name: _is_code(name) or name == 'Settings.cfg')
+    if report is not None:
+        report.update(scan_report)
+
+    # detect if provided folder_path itself is a single student's folder
+    if any(True for _ in tree.files_within(2, _is_code)):
         # treat this folder as a single student
         student_name = os.path.basename(os.path.normpath(folder_path))
         students = {student_name: {"Name": student_name, "BaiLam": {}, "Scores": {}}}
         s = students[student_name]
-        for root, dirs, files in os.walk(folder_path):
-            rel = os.path.relpath(root, folder_path)
-            if rel.count(os.sep) > 1:
-                continue
-            for f in files:
-                if not f.lower().endswith(code_exts):
-                    continue
-                s['BaiLam'][f] = os.path.join(root, f)
+        for f, absf in tree.files_within(2, _is_code):
+            s['BaiLam'][f] = absf
 
         # compute scores against exams
         for exam_name in exams.keys():
             matched = any(os.path.splitext(fname)[0] == exam_name for fname in s['BaiLam'].keys())
             s['Scores'][exam_name] = 0 if matched else -1
+        stale = _merge_previous(students, exams, folder_path, tree.metadata(), old_students, report)
 
         # write students_submissions.json as list
         students_list = list(students.values())
@@ -234,7 +328,7 @@ def process_student_folder(folder_path: str):
         for exam_name, ex in exams.items():
             if 'Students' not in ex or not isinstance(ex.get('Students'), dict):
                 ex['Students'] = {}
-            ex['Students'][student_name] = int(s['Scores'].get(exam_name, -1))
+            ex['Students'][student_name] = s['Scores'].get(exam_name, -1)
         try:
             # write back into data/answers_settings.json
             with open(Path(__file__).resolve().parent / 'data' / 'answers_settings.json', 'w', encoding='utf-8') as f:
@@ -242,33 +336,20 @@ def process_student_folder(folder_path: str):
         except Exception:
             pass
 
+        _reset_results(stale)
+
         return str(out_students), list(students.values())
 
     # detect layout: student-first vs problem-first
-    code_exts = ('.cpp', '.py', '.pas', '.pascal')
     student_like = 0
     problem_like = 0
-    for entry in os.listdir(folder_path):
-        entry_path = os.path.join(folder_path, entry)
-        if not os.path.isdir(entry_path):
-            continue
-        # if this dir contains a Settings.cfg or many test folders, count as problem-like
-        if os.path.isfile(os.path.join(entry_path, 'Settings.cfg')):
+    for node in tree.dirs.values():
+        # if this dir contains a Settings.cfg, count as problem-like
+        if 'Settings.cfg' in node.files:
             problem_like += 1
             continue
         # if this dir contains code files directly or in a child folder, count as student-like
-        found_code = False
-        for root, dirs, files in os.walk(entry_path):
-            for f in files:
-                if f.lower().endswith(code_exts):
-                    found_code = True
-                    break
-            if found_code:
-                break
-            # limit detection depth
-            if os.path.relpath(root, entry_path).count(os.sep) >= 1:
-                break
-        if found_code:
+        if any(True for _ in node.files_within(2, _is_code)):
             student_like += 1
 
     layout = 'student' if student_like >= problem_like else 'problem'
@@ -280,74 +361,36 @@ def process_student_folder(folder_path: str):
         return students[name]
 
     if layout == 'student':
-        # treat each top-level dir as student folder
-        for entry in sorted(os.listdir(folder_path)):
-            entry_path = os.path.join(folder_path, entry)
-            if not os.path.isdir(entry_path):
-                continue
-            student_name = entry
+        # treat each top-level dir as student folder, files up to two levels deep
+        for student_name in sorted(tree.dirs):
             s = _ensure_student(student_name)
-            # scan files one level deep under student folder
-            for root, dirs, files in os.walk(entry_path):
-                rel = os.path.relpath(root, entry_path)
-                if rel.count(os.sep) > 1:
-                    continue
-                for f in files:
-                    if not f.lower().endswith(code_exts):
-                        continue
-                    absf = os.path.join(root, f)
-                    s['BaiLam'][f] = absf
+            for f, absf in tree.dirs[student_name].files_within(2, _is_code):
+                s['BaiLam'][f] = absf
 
     else:
         # problem-first: each top-level dir is a problem; look for student submissions inside
-        # two-pass approach: first, collect basenames of files directly under problem folders
+        # first collect basenames of files directly under problem folders
         basename_counts = {}
-        direct_files = []  # tuples (prob, fname, fullpath)
-        for prob in sorted(os.listdir(folder_path)):
-            prob_path = os.path.join(folder_path, prob)
-            if not os.path.isdir(prob_path):
-                continue
-            for child in sorted(os.listdir(prob_path)):
-                child_path = os.path.join(prob_path, child)
-                if os.path.isfile(child_path) and any(child.lower().endswith(ext) for ext in code_exts):
+        for prob_node in tree.dirs.values():
+            for child in prob_node.files:
+                if _is_code(child):
                     base = os.path.splitext(child)[0]
                     basename_counts[base] = basename_counts.get(base, 0) + 1
-                    direct_files.append((prob, child, child_path))
-
-        # now process each problem: handle student-folder children and direct files only when basename appears multiple times
-        for prob in sorted(os.listdir(folder_path)):
-            prob_path = os.path.join(folder_path, prob)
-            if not os.path.isdir(prob_path):
-                continue
-            # look for per-student subfolders
-            for child in sorted(os.listdir(prob_path)):
-                child_path = os.path.join(prob_path, child)
-                if os.path.isdir(child_path):
-                    # child may be a student folder containing code files
-                    found_any = False
-                    for root, dirs, files in os.walk(child_path):
-                        rel = os.path.relpath(root, child_path)
-                        if rel.count(os.sep) > 1:
-                            continue
-                        for f in files:
-                            if not f.lower().endswith(code_exts):
-                                continue
-                            student_name = child
-                            s = _ensure_student(student_name)
-                            s['BaiLam'][f] = os.path.join(root, f)
-                            found_any = True
-                    if found_any:
-                        continue
-            # handle direct files under the problem folder, but only treat basename as student if it appears in multiple problems
-            for prob2, child, child_path in direct_files:
-                if prob2 != prob:
+
+        for prob in sorted(tree.dirs):
+            prob_node = tree.dirs[prob]
+            # per-student subfolders containing code files
+            for child in sorted(prob_node.dirs):
+                for f, absf in prob_node.dirs[child].files_within(2, _is_code):
+                    _ensure_student(child)['BaiLam'][f] = absf
+            # direct files under the problem folder, treated as a student's only
+            # when the basename appears in multiple problems
+            for child in sorted(prob_node.files):
+                if not _is_code(child):
                     continue
                 base = os.path.splitext(child)[0]
                 if basename_counts.get(base, 0) >= 2:
-                    # treat as student submission file named by basename
-                    student_name = base
-                    s = _ensure_student(student_name)
-                    s['BaiLam'][child] = child_path
+                    _ensure_student(base)['BaiLam'][child] = os.path.join(prob_node.path, child)
 
     # now compute Scores per student per exam according to matching rule:
     # if student has a file whose basename == exam name -> score 0 (ready to grade)
@@ -360,6 +403,7 @@ def process_student_folder(folder_path: str):
                     matched = True
                     break
             sdata['Scores'][exam_name] = 0 if matched else -1
+    stale = _merge_previous(students, exams, folder_path, tree.metadata(), old_students, report)
 
     # prepare list format as requested by user
     students_list = list(students.values())
@@ -371,8 +415,8 @@ def process_student_folder(folder_path: str):
         if 'Students' not in ex or not isinstance(ex.get('Students'), dict):
             ex['Students'] = {}
         for sname, sdata in students.items():
-            # set 0 if matched, -1 if not
-            ex['Students'][sname] = int(sdata['Scores'].get(exam_name, -1))
+            # 0 if matched, -1 if not, or the score kept from the previous scan
+            ex['Students'][sname] = sdata['Scores'].get(exam_name, -1)
 
     # write back answers_settings.json
     try:
@@ -381,6 +425,9 @@ def process_student_folder(folder_path: str):
     except Exception:
         pass
 
+    # stored results of changed submissions are dropped, the others kept
+    _reset_results(stale)
+
     return str(out_students), students_list
 
 
@@ -409,10 +456,12 @@ def setting(stdscr):
                     stdscr.addstr(5, 0, "Folder hợp lệ, quét các subfolder...")
                     stdscr.refresh()
                     try:
-                        out_file, results = process_answer_folder(path)
+                        report = {}
+                        out_file, results = process_answer_folder(path, report)
                         stdscr.addstr(6, 0, f"Đã lưu index: {out_file}")
                         ok_count = sum(1 for v in results.values() if 'ExamInformation' in v)
                         stdscr.addstr(7, 0, f"Parsed: {ok_count} entries, total: {len(results)}")
+                        stdscr.addstr(8, 0, scan_summary(report))
                     except Exception as e:
                         stdscr.addstr(6, 0, f"Lỗi khi quét folder: {e}")
                 else:
@@ -428,9 +477,11 @@ def setting(stdscr):
                     stdscr.addstr(5, 0, "File hợp lệ, quét bài làm thí sinh...")
                     stdscr.refresh()
                     try:
-                        out_students, students = process_student_folder(path)
+                        report = {}
+                        out_students, students = process_student_folder(path, report)
                         stdscr.addstr(6, 0, f"Đã lưu danh sách thí sinh: {out_students}")
                         stdscr.addstr(7, 0, f"Tổng thí sinh: {len(students)}")
+                        stdscr.addstr(8, 0, scan_summary(report))
                     except Exception as e:
                         stdscr.addstr(6, 0, f"Lỗi khi quét folder thí sinh: {e}")
                 else:
@@ -443,105 +494,6 @@ def setting(stdscr):
         elif action == "quit":
             break
 
-def run_program(cmd, input_path, timeout_sec, memory_mb=None):
-    """Run a command string with input redirected from input_path.
-    Return (returncode, stdout, stderr, timed_out)
-    """
-    try:
-        with open(input_path, 'rb') as fin:
-            # if prlimit is available, use it to apply memory and cpu limits
-            prlimit = shutil.which('prlimit')
-            if prlimit and memory_mb is not None:
-                # compute bytes for address space and pass as single-arg options
-                as_bytes = int(memory_mb) * 1024 * 1024
-                # use --as=<bytes> and --cpu=<seconds> form to avoid some prlimit variants
-                wrapped = [prlimit, f'--as={as_bytes}', f'--cpu={int(timeout_sec)}', '--'] + shlex.split(cmd)
-                proc = subprocess.run(wrapped, stdin=fin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout_sec + 1)
-            else:
-                proc = subprocess.run(shlex.split(cmd), stdin=fin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout_sec)
-            return proc.returncode, proc.stdout, proc.stderr, False
-    except subprocess.TimeoutExpired:
-        return -1, b'', b'Timeout', True
-    except FileNotFoundError as e:
-        return -2, b'', str(e).encode('utf-8'), False
-    except Exception as e:
-        return -3, b'', str(e).encode('utf-8'), False
-
-
-def find_test_io(tc, workdir, prob_name, answers_index=None):
-    """Find input and expected output paths for a test case."""
-    tc_name = tc.get('Name') if isinstance(tc, dict) else str(tc)
-    cand_in = []
-    cand_out = []
-
-    # Check TestCase attributes first
-    if isinstance(tc, dict):
-        for k in ('Input', 'InputFile', 'Inp'):
-            v = tc.get(k)
-            if v:
-                cand_in.append(v)
-        for k in ('Output', 'OutputFile', 'Out'):
-            v = tc.get(k)
-            if v:
-                cand_out.append(v)
-
-    # If problem path available in answers_index
-    if answers_index and isinstance(answers_index, dict):
-        prob_path = answers_index.get('Path')
-        if prob_path and os.path.isdir(prob_path):
-            # Check test subfolder with same name as test case
-            test_subdir = os.path.join(prob_path, tc_name)
-            if os.path.isdir(test_subdir):
-                # Search in test subfolder
-                for f in os.listdir(test_subdir):
-                    fp = os.path.join(test_subdir, f)
-                    if f.lower().endswith(('.inp', '.in')):
-                        cand_in.append(fp)
-                    elif f.lower().endswith('.out'):
-                        cand_out.append(fp)
-
-            # Check common test folders
-            for test_dir in ('tests', 'testdata', 'data', 'input', tc_name):
-                test_path = os.path.join(prob_path, test_dir)
-                if os.path.isdir(test_path):
-                    # Add candidates with various extensions
-                    for ext in ('.INP', '.inp', '.in'):
-                        cand_in.append(os.path.join(test_path, tc_name + ext))
-                        cand_in.append(os.path.join(test_path, prob_name + ext))
-                    cand_out.append(os.path.join(test_path, tc_name + '.OUT'))
-                    cand_out.append(os.path.join(test_path, tc_name + '.out'))
-
-    # Add local submission directory candidates
-    cand_in += [
-        os.path.join(workdir, tc_name + '.INP'),
-        os.path.join(workdir, tc_name + '.in'),
-        os.path.join(workdir, tc_name + '.inp'),
-        os.path.join(workdir, prob_name + '.INP'),
-        os.path.join(workdir, prob_name + '.in')
-    ]
-
-    # Find first existing input file
-    input_path = None
-    for p in cand_in:
-        if p and os.path.exists(p):
-            input_path = p
-            break
-
-    # Find first existing output file
-    output_path = None
-    for p in cand_out:
-        if p and os.path.exists(p):
-            output_path = p
-            break
-
-    # If no output found but input exists, try corresponding .OUT file
-    if input_path and not output_path:
-        guess_out = input_path.replace('.INP', '.OUT').replace('.inp', '.out').replace('.in', '.out')
-        if os.path.exists(guess_out):
-            output_path = guess_out
-
-    return input_path, output_path
-
 def show_student_details(stdscr, student_id_or_name: str):
     """Hiển thị chi tiết một thí sinh dựa trên ID hoặc tên."""
     data_dir = os.path.join(os.getcwd(), 'data')
@@ -608,8 +560,12 @@ def show_student_details(stdscr, student_id_or_name: str):
                 name = test.get('Test', '')
                 mark = test.get('MarkEarned', 0)
                 result_line = f"  {status} Test {name}: {mark} điểm"
+                if 'CpuTime' in test:
+                    result_line += f" [{test['CpuTime']:.3f}s, {(test.get('PeakRssKB') or 0) / 1024:.1f}MB]"
                 if not test.get('Passed'):
-                    if test.get('TimedOut'):
+                    if test.get('Verdict') == 'MLE':
+                        result_line += " (Memory limit exceeded)"
+                    elif test.get('TimedOut'):
                         result_line += " (Time limit exceeded)"
                     elif test.get('Ret') != 0:
                         result_line += f" (Runtime error: {test.get('Ret')})"
@@ -634,198 +590,57 @@ def show_student_details(stdscr, student_id_or_name: str):
 def start_grading(stdscr):
     """Interactive grading flow triggered from main menu.
     For each student and each exam, run their submission against available input files
-    and compare stdout with expected output files. Shows a per-test log page and
-    updates `data/students_submissions.json` and `data/answers_settings.json`.
-    This is a best-effort implementation: timeouts enforced; memory limits not enforced.
+    and compare stdout with expected output files. Tests are run in parallel by
+    grader.grade_all; a per-test log page is shown as results come back and
+    each finished (student, problem) pair is committed to `data/results.db`;
+    `data/students_submissions.json` and `data/answers_settings.json` are
+    exported from it at the end.
+    Time and memory limits are enforced by limiter (setting.LIMITER_BACKEND).
     """
     curses.curs_set(0)
-    base = os.path.dirname(__file__)
-    data_answers = os.path.join(base, 'data', 'answers_settings.json')
-    data_students = os.path.join(base, 'data', 'students_submissions.json')
-    try:
-        with open(data_answers, 'r', encoding='utf-8') as f:
-            answers = json.load(f)
-    except Exception:
-        answers = {}
-    try:
-        with open(data_students, 'r', encoding='utf-8') as f:
-            students = json.load(f)
-    except Exception:
-        students = []
-
-    # students is a list of student dicts
-    for student in students:
-        name = student.get('Name')
-        bai_lam = student.get('BaiLam', {})
-        scores = student.get('Scores', {})
-
-        for prob_name, prob_def in answers.items():
-            # find student's submission file for this problem
-            sub_path = None
-            for fname, fpath in bai_lam.items():
-                if prob_name.upper() in fname.upper() or os.path.splitext(fname)[0].upper() == prob_name.upper():
-                    sub_path = fpath
-                    break
-            if not sub_path:
-                # student didn't submit for this prob
-                continue
-
-            cmd = None
-            sub_lower = sub_path.lower()
-            workdir = os.path.dirname(sub_path)
-
-            if sub_lower.endswith('.py'):
-                cmd = f"{shlex.quote(sys.executable)} {shlex.quote(sub_path)}"
-            elif sub_lower.endswith('.cpp'):
-                bin_name = os.path.join(workdir, os.path.splitext(os.path.basename(sub_path))[0])
-                compile_cmd = f"g++ -O2 -std=gnu++17 {shlex.quote(sub_path)} -o {shlex.quote(bin_name)}"
-                try:
-                    cproc = subprocess.run(shlex.split(compile_cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=20)
-                    if cproc.returncode == 0:
-                        cmd = shlex.quote(bin_name)
-                    else:
-                        cmd = None
-                except Exception:
-                    cmd = None
-            else:
-                cmd = shlex.quote(sub_path)
-
-            if not cmd:
-                scores[prob_name] = 0
-                student['Scores'] = scores
-                continue
-
-            testcases = prob_def.get('TestCases', [])
-            exam_info = prob_def.get('ExamInformation', {})
-            tl = int(exam_info.get('TimeLimit', 1))
-
-            earned = 0.0
-            total_marks = 0.0
-            for tc in testcases:
-                tc_name = tc.get('Name')
-                try:
-                    tc_mark = float(tc.get('Mark', 0))
-                except Exception:
-                    tc_mark = 0.0
-                total_marks += tc_mark
-
-                # Use the module-level find_test_io instead of redefining it
-                input_path, expected = find_test_io(tc, workdir, prob_name, prob_def)
-
-                if not input_path:
-                    passed = False
-                    ret = -9
-                    stdout = b''
-                    stderr = b''
-                    timed_out = False
-                else:
-                    # determine memory limit per test (TestCase->ExamInformation->global default)
-                    mem_mb = None
-                    try:
-                        mm = tc.get('MemoryLimit') or exam_info.get('MemoryLimit')
-                        if mm is not None and str(mm) != "-1":
-                            mem_mb = int(mm)
-                    except Exception:
-                        mem_mb = None
-                    ret, stdout, stderr, timed_out = run_program(cmd, input_path, tl, memory_mb=mem_mb)
-                    # expected output was returned by find_test_io; if missing, try some common fallbacks
-                    if not expected:
-                        expected_candidates = [input_path.replace('.INP', '.OUT'), input_path.replace('.inp', '.out'), os.path.join(workdir, tc_name + '.OUT')]
-                        for ep in expected_candidates:
-                            if os.path.exists(ep):
-                                expected = ep
-                                break
-                    # comparison: normalize text
-                    def normalize_text(b: bytes):
-                        try:
-                            s = b.decode('utf-8')
-                        except Exception:
-                            s = b.decode('latin-1', errors='replace')
-                        s = s.replace('\r\n', '\n').strip()
-                        # normalize each line by stripping trailing spaces
-                        lines = [ln.rstrip() for ln in s.split('\n')]
-                        return '\n'.join(lines)
-
-                    evaluator = exam_info.get('EvaluatorName', '') or ''
-                    ignore_case = 'IgnoreCase' in evaluator
-
-                    if expected:
-                        with open(expected, 'rb') as ef:
-                            exp_bytes = ef.read()
-                        out_bytes = stdout
-                        norm_exp = normalize_text(exp_bytes)
-                        norm_out = normalize_text(out_bytes)
-                        if ignore_case:
-                            norm_exp = norm_exp.lower()
-                            norm_out = norm_out.lower()
-                        passed = (norm_out == norm_exp) and not timed_out and ret == 0
-                    else:
-                        passed = False
-
-                # show log page
-                stdscr.clear()
-                stdscr.addstr(0, 0, f"Student: {name}  Problem: {prob_name}  Test: {tc_name}")
-                stdscr.addstr(2, 0, f"Cmd: {cmd}")
-                stdscr.addstr(3, 0, f"Return: {ret} TimedOut: {timed_out}")
-                try:
-                    stdscr.addstr(5, 0, stdout.decode('utf-8', errors='replace')[:800])
-                except Exception:
-                    pass
-                try:
-                    stdscr.addstr(13, 0, stderr.decode('utf-8', errors='replace')[:800])
-                except Exception:
-                    pass
-                stdscr.addstr(21, 0, f"Passed: {passed}")
-                stdscr.refresh()
-                # auto-advance: brief pause so user can observe, then continue
-                time.sleep(0.05)
-
-                # record test result
-                tr = {
-                    'Test': tc_name,
-                    'Passed': bool(passed),
-                    'Ret': int(ret) if isinstance(ret, int) else -1,
-                    'TimedOut': bool(timed_out),
-                    'MarkEarned': float(tc_mark) if passed else 0.0,
-                }
-                # include truncated stdout/stderr
-                try:
-                    tr['Stdout'] = stdout.decode('utf-8', errors='replace')[:2000]
-                except Exception:
-                    tr['Stdout'] = ''
-                try:
-                    tr['Stderr'] = stderr.decode('utf-8', errors='replace')[:2000]
-                except Exception:
-                    tr['Stderr'] = ''
-
-                # append to student TestResults
-                if 'TestResults' not in student or not isinstance(student['TestResults'], dict):
-                    student['TestResults'] = {}
-                if prob_name not in student['TestResults'] or not isinstance(student['TestResults'][prob_name], list):
-                    student['TestResults'][prob_name] = []
-                student['TestResults'][prob_name].append(tr)
-
-                if passed:
-                    earned += tc_mark
+    students, answers = grader.load_data()
+    test_manifest.refresh_all(answers)
+    last_draw = 0.0
+
+    def show_log(job, tr, stdout, stderr, done, total):
+        nonlocal last_draw
+        # redraw at most 10 times per second, the pool does not wait for the screen
+        now = time.monotonic()
+        if now - last_draw < 0.1 and done < total:
+            return
+        last_draw = now
+        # show log page
+        stdscr.clear()
+        stdscr.addstr(0, 0, f"Student: {job['Name']}  Problem: {job['Problem']}  Test: {job['Test']}  ({done}/{total})")
+        stdscr.addstr(2, 0, f"Cmd: {job['Cmd']}")
+        stdscr.addstr(3, 0, f"Return: {tr['Ret']} TimedOut: {tr['TimedOut']}  "
+                            f"CPU: {tr.get('CpuTime', 0):.3f}s  Wall: {tr.get('WallTime', 0):.3f}s  "
+                            f"RSS: {(tr.get('PeakRssKB') or 0) / 1024:.1f}MB")
+        try:
+            stdscr.addstr(5, 0, stdout.decode('utf-8', errors='replace')[:800])
+        except Exception:
+            pass
+        try:
+            stdscr.addstr(13, 0, stderr.decode('utf-8', errors='replace')[:800])
+        except Exception:
+            pass
+        stdscr.addstr(21, 0, f"Passed: {tr['Passed']}")
+        stdscr.refresh()
 
-            # use raw marks (sum of earned marks) instead of percentage
-            scores[prob_name] = earned
-            student['Scores'] = scores
+    store = results_store.open_store()
+    store.sync(students, answers)
 
-            # update answers mapping with raw marks
-            if prob_name in answers:
-                if 'Students' not in answers[prob_name] or not isinstance(answers[prob_name].get('Students'), dict):
-                    answers[prob_name]['Students'] = {}
-                answers[prob_name]['Students'][name] = earned
+    def write_progress(student, prob_name):
+        # each finished pair is committed to the store on its own
+        store.record_student_pair(student, prob_name)
 
-            # write progress
-            try:
-                with open(data_students, 'w', encoding='utf-8') as f:
-                    json.dump(students, f, ensure_ascii=False, indent=2)
-                with open(data_answers, 'w', encoding='utf-8') as f:
-                    json.dump(answers, f, ensure_ascii=False, indent=2)
-            except Exception:
-                pass
+    try:
+        grader.grade_all(students, answers, on_result=show_log, on_pair_done=write_progress,
+                         previous=store.pair_results, on_scores=store.publish_scoreboard)
+    finally:
+        # JSON files are regenerated for the scoreboard and the report tools
+        store.export_json()
+        store.close()
 
     # final
     stdscr.clear()
@@ -835,4 +650,3 @@ def start_grading(stdscr):
         c = stdscr.getch()
         if c in (10, 13):
             break
-
@@ -0,0 +1,271 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+DATA_DIR = Path(__file__).resolve().parent / 'data'
+DB_PATH = DATA_DIR / 'results.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS problems (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS students (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scores (
+    student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
+    problem_id INTEGER NOT NULL REFERENCES problems(id) ON DELETE CASCADE,
+    score REAL NOT NULL,
+    compile_error TEXT,
+    PRIMARY KEY (student_id, problem_id)
+);
+CREATE TABLE IF NOT EXISTS test_results (
+    student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
+    problem_id INTEGER NOT NULL REFERENCES problems(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    test TEXT,
+    passed INTEGER NOT NULL,
+    mark REAL NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (student_id, problem_id, idx)
+);
+CREATE INDEX IF NOT EXISTS idx_scores_problem ON scores(problem_id);
+CREATE INDEX IF NOT EXISTS idx_test_results_problem ON test_results(problem_id);
+"""
+
+# keys that are grading results, everything else in a student dict is scan metadata
+_RESULT_KEYS = ('TestResults', 'CompileErrors')
+
+
+class ResultsStore:
+    """SQLite store for grading results.
+
+    Every (student, problem) pair is written in its own transaction, so a crash
+    never leaves a half-written pair behind and the cost of an update does not
+    grow with the size of the contest. students_submissions.json and
+    answers_settings.json are produced from the store on demand by export_json.
+    """
+
+    def __init__(self, path=DB_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = str(path)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- lookup ----------
+    def _student_id(self, name: str):
+        row = self.conn.execute("SELECT id FROM students WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _problem_id(self, name: str):
+        row = self.conn.execute("SELECT id FROM problems WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    # ---------- writes ----------
+    def sync(self, students: list, answers: dict):
+        """Mirror the scanned students and problems into the store.
+
+        Metadata (BaiLam, ExamInformation, TestCases, ...) is upserted, entries
+        that disappeared from the scan are removed with their results, and
+        results already present in the JSON but not yet in the store are
+        imported once.
+        """
+        with self.conn:
+            for pos, (name, prob) in enumerate(answers.items()):
+                base = {k: v for k, v in prob.items() if k != 'Students'}
+                self.conn.execute(
+                    "INSERT INTO problems(name, position, data) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET position = excluded.position, data = excluded.data",
+                    (name, pos, json.dumps(base, ensure_ascii=False)))
+            self._delete_missing('problems', list(answers))
+
+            names = []
+            for pos, student in enumerate(students):
+                name = student.get('Name')
+                if not name:
+                    continue
+                names.append(name)
+                base = {k: v for k, v in student.items() if k not in _RESULT_KEYS}
+                self.conn.execute(
+                    "INSERT INTO students(name, position, data) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET position = excluded.position, data = excluded.data",
+                    (name, pos, json.dumps(base, ensure_ascii=False)))
+            self._delete_missing('students', names)
+
+        # one-time import of results graded before the store existed
+        for student in students:
+            name = student.get('Name')
+            test_results = student.get('TestResults') or {}
+            compile_errors = student.get('CompileErrors') or {}
+            for prob_name in answers:
+                if prob_name not in test_results and prob_name not in compile_errors:
+                    continue
+                if self.has_pair(name, prob_name):
+                    continue
+                self.record_student_pair(student, prob_name)
+
+    def _delete_missing(self, table: str, names: list):
+        existing = [r[0] for r in self.conn.execute(f"SELECT name FROM {table}")]
+        keep = set(names)
+        for name in existing:
+            if name not in keep:
+                self.conn.execute(f"DELETE FROM {table} WHERE name = ?", (name,))
+
+    def has_pair(self, student_name: str, prob_name: str) -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM scores s JOIN students st ON st.id = s.student_id "
+            "JOIN problems p ON p.id = s.problem_id WHERE st.name = ? AND p.name = ?",
+            (student_name, prob_name)).fetchone()
+        return row is not None
+
+    def pair_results(self, student_name: str, prob_name: str) -> list:
+        """Stored TestResults of one pair in test order ([] when never graded)."""
+        rows = self.conn.execute(
+            "SELECT tr.data FROM test_results tr JOIN students st ON st.id = tr.student_id "
+            "JOIN problems p ON p.id = tr.problem_id WHERE st.name = ? AND p.name = ? ORDER BY tr.idx",
+            (student_name, prob_name)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def record_pair(self, student_name: str, prob_name: str, results: list, score: float, compile_error: str = None):
+        """Atomically replace the test results and score of one pair."""
+        sid = self._student_id(student_name)
+        pid = self._problem_id(prob_name)
+        if sid is None or pid is None:
+            return
+        with self.conn:
+            self.conn.execute("DELETE FROM test_results WHERE student_id = ? AND problem_id = ?", (sid, pid))
+            self.conn.executemany(
+                "INSERT INTO test_results(student_id, problem_id, idx, test, passed, mark, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(sid, pid, i, tr.get('Test'), int(bool(tr.get('Passed'))), float(tr.get('MarkEarned', 0.0)),
+                  json.dumps(tr, ensure_ascii=False)) for i, tr in enumerate(results)])
+            self.conn.execute(
+                "INSERT INTO scores(student_id, problem_id, score, compile_error) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(student_id, problem_id) DO UPDATE SET score = excluded.score, compile_error = excluded.compile_error",
+                (sid, pid, float(score), compile_error))
+
+    def record_student_pair(self, student: dict, prob_name: str):
+        """record_pair from a student dict as filled in by grader.grade_all."""
+        results = (student.get('TestResults') or {}).get(prob_name, [])
+        score = (student.get('Scores') or {}).get(prob_name, 0)
+        compile_error = (student.get('CompileErrors') or {}).get(prob_name)
+        self.record_pair(student.get('Name'), prob_name, results, score, compile_error)
+
+    def clear_pairs(self, pairs):
+        """Drop the score and test results of the given (student name, problem
+        name) pairs (used for the submissions that changed on a rescan)."""
+        with self.conn:
+            for student_name, prob_name in pairs:
+                sid = self._student_id(student_name)
+                pid = self._problem_id(prob_name)
+                if sid is None or pid is None:
+                    continue
+                self.conn.execute("DELETE FROM test_results WHERE student_id = ? AND problem_id = ?", (sid, pid))
+                self.conn.execute("DELETE FROM scores WHERE student_id = ? AND problem_id = ?", (sid, pid))
+
+    def clear_results(self):
+        """Drop every score and test result (used when another submissions folder is scanned)."""
+        with self.conn:
+            self.conn.execute("DELETE FROM test_results")
+            self.conn.execute("DELETE FROM scores")
+
+    # ---------- reads / export ----------
+    def load(self):
+        """Rebuild (students, answers) in the JSON shape used by the UI."""
+        problems = {}
+        for pid, name, data in self.conn.execute("SELECT id, name, data FROM problems ORDER BY position"):
+            problems[pid] = (name, json.loads(data))
+        students = {}
+        for sid, name, data in self.conn.execute("SELECT id, name, data FROM students ORDER BY position"):
+            students[sid] = json.loads(data)
+
+        answers = {name: dict(data) for name, data in problems.values()}
+        for prob in answers.values():
+            prob['Students'] = {}
+        for student in students.values():
+            for prob_name, score in (student.get('Scores') or {}).items():
+                if prob_name in answers:
+                    answers[prob_name]['Students'][student['Name']] = score
+
+        for sid, pid, score, compile_error in self.conn.execute(
+                "SELECT student_id, problem_id, score, compile_error FROM scores"):
+            if sid not in students or pid not in problems:
+                continue
+            student = students[sid]
+            prob_name = problems[pid][0]
+            student.setdefault('Scores', {})[prob_name] = score
+            answers[prob_name]['Students'][student['Name']] = score
+            if compile_error is not None:
+                student.setdefault('CompileErrors', {})[prob_name] = compile_error
+
+        for sid, pid, data in self.conn.execute(
+                "SELECT student_id, problem_id, data FROM test_results ORDER BY student_id, problem_id, idx"):
+            if sid not in students or pid not in problems:
+                continue
+            tests = students[sid].setdefault('TestResults', {})
+            tests.setdefault(problems[pid][0], []).append(json.loads(data))
+
+        # keep TestResults in problem order
+        order = [name for name, _ in problems.values()]
+        for student in students.values():
+            if 'TestResults' in student:
+                tr = student['TestResults']
+                student['TestResults'] = {p: tr[p] for p in order if p in tr}
+        return list(students.values()), answers
+
+    def export_json(self, data_dir=DATA_DIR):
+        """Write students_submissions.json and answers_settings.json from the store.
+        Files are replaced atomically. Returns the two paths.
+        """
+        students, answers = self.load()
+        students_path = Path(data_dir) / 'students_submissions.json'
+        answers_path = Path(data_dir) / 'answers_settings.json'
+        _atomic_write_json(students_path, students)
+        _atomic_write_json(answers_path, answers)
+        return str(students_path), str(answers_path)
+
+    def publish_scoreboard(self, rows: list, data_dir=DATA_DIR):
+        """Write a (partial) grader.scoreboard to scoreboard.json, atomically,
+        so the ranking can be followed while grading is still running."""
+        path = Path(data_dir) / 'scoreboard.json'
+        _atomic_write_json(path, {'Updated': time.strftime('%Y-%m-%d %H:%M:%S'), 'Ranking': rows})
+        return str(path)
+
+
+def _atomic_write_json(path: Path, obj):
+    fd, tmp = tempfile.mkstemp(prefix='.' + path.name, dir=path.parent)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def open_store(path=DB_PATH) -> ResultsStore:
+    return ResultsStore(path)
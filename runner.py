@@ -0,0 +1,503 @@
+import asyncio
+import os
+import resource
+import selectors
+import shlex
+import signal
+import subprocess
+import time
+
+import config
+import limiter as _limiter
+
+# bytes of stdout/stderr kept for TestResults and the log page
+KEEP_BYTES = 4096
+# seconds between two samples of the child's CPU time and VmHWM (see _peak_rss)
+RSS_SAMPLE_INTERVAL = 0.01
+# seconds spent reading output left in the pipes once the program has exited
+DRAIN_SECONDS = 0.5
+_CLK_TCK = os.sysconf('SC_CLK_TCK')
+
+
+def wall_time_factor() -> float:
+    return config.get('WALL_TIME_FACTOR', 3.0, float)
+
+
+def borderline_margin() -> float:
+    return config.get('BORDERLINE_MARGIN', 0.1, float)
+
+
+def output_limit_bytes() -> int:
+    return config.get('OUTPUT_LIMIT_MB', 64, int) * 1024 * 1024
+
+
+def _vm_hwm_kb(pid: int) -> int:
+    """VmHWM (peak RSS, kB) of a live process from /proc, 0 when unavailable."""
+    try:
+        with open(f'/proc/{pid}/status', 'rb') as f:
+            for line in f:
+                if line.startswith(b'VmHWM:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def _cpu_seconds(pid: int) -> float:
+    """user + sys CPU time of a live process from /proc (0 when unavailable)."""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            data = f.read()
+        fields = data[data.rfind(b')') + 2:].split()
+        # utime and stime are fields 14 and 15 of stat, in clock ticks
+        return (int(fields[11]) + int(fields[12])) / _CLK_TCK
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def _peak_rss(ru_maxrss: int, floor_kb: int, sampled_kb: int) -> int:
+    """Peak RSS of the child in kB.
+
+    Linux carries the RSS of the image that called exec into ru_maxrss, so a
+    child spawned from this (large) process reports at least our own peak.
+    A value above that floor can only come from the program itself; below it
+    the VmHWM sampled from /proc while the program ran is used instead, and
+    None is returned for a program that finished before the first sample.
+    """
+    if ru_maxrss > floor_kb:
+        return ru_maxrss
+    return sampled_kb or None
+
+
+def _session_members(sid: int) -> list:
+    """(pid, pgrp, comm) of the live processes in session or process group sid."""
+    members = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat', 'rb') as f:
+                data = f.read()
+        except OSError:
+            continue
+        # comm may contain spaces and parentheses: the fixed fields follow the last ')'
+        rparen = data.rfind(b')')
+        fields = data[rparen + 2:].split()
+        try:
+            state, pgrp, session = fields[0], int(fields[2]), int(fields[3])
+        except (IndexError, ValueError):
+            continue
+        if state != b'Z' and sid in (pgrp, session):
+            members.append((int(name), pgrp, data[data.find(b'(') + 1:rparen].decode('utf-8', errors='replace')))
+    return members
+
+
+def _sweep(sid: int, leaked: dict, group_killed: bool = False):
+    """Kill whatever is left of the session sid after its leader was reaped,
+    adding the processes that outlived the program to leaked (pid -> name).
+
+    When the group was killed on purpose (timeout, verdict), its members that
+    are still dying are not leaks; only processes that left the group are.
+    The /proc scan only runs when the process group still has members, so a
+    clean run costs one kill(0) call.
+    """
+    try:
+        os.killpg(sid, 0)
+    except (ProcessLookupError, PermissionError):
+        if group_killed:
+            return
+    members = _session_members(sid)
+    try:
+        os.killpg(sid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    for pid, pgrp, comm in members:
+        if pgrp != sid:
+            # moved to another group of the same session
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        if not (group_killed and pgrp == sid):
+            leaked.setdefault(pid, comm)
+
+
+def _kill_group(proc):
+    """SIGKILL the whole process group of proc (the child is its leader).
+    os.killpg rather than proc.kill: Popen.kill polls and may reap the
+    child itself, losing its rusage."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        os.kill(proc.pid, signal.SIGKILL)
+
+
+def _reap(proc, deadline=None):
+    """Wait for proc with os.wait4 and return (exit_time, rusage), or None if
+    it is still running at deadline (monotonic). proc.returncode is set so
+    Popen does not try to wait for the pid again. rusage is None when the
+    child was already reaped by Popen itself (e.g. inside kill()).
+    """
+    delay = 0.0005
+    while True:
+        try:
+            pid, status, ru = os.wait4(proc.pid, 0 if deadline is None else os.WNOHANG)
+        except ChildProcessError:
+            if proc.returncode is None:
+                proc.returncode = -1
+            return time.monotonic(), None
+        if pid:
+            ended = time.monotonic()
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return ended, ru
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        # the pipes are closed, so the child is close to exiting: poll with backoff
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.01)
+
+
+def run_program(cmd, input_path, timeout_sec, memory_mb=None, stream_checker=None, output_limit=None,
+                keep_bytes=KEEP_BYTES, limiter=None, wall_factor=None, cpus=None, cwd=None):
+    """Run a command string with input redirected from input_path (None: no
+    input) in the working directory cwd (default: ours).
+
+    timeout_sec is a CPU time limit: a run whose measured CpuTime exceeds it
+    is a timeout even if it finished. The program is stopped once its CPU time
+    (sampled from /proc) passes the limit by more than the borderline margin
+    (setting.BORDERLINE_MARGIN), so a run that ends just over the limit keeps
+    its real CpuTime and one stopped for CPU time is clearly over it. Wall time is only a safety
+    net for sleeping or starved programs, at timeout_sec * wall_factor
+    (setting.WALL_TIME_FACTOR by default); WallTimedOut tells that case.
+
+    stdout is read as it is produced: every chunk goes to stream_checker.feed()
+    (if given) and the process is killed on the first definitive mismatch or
+    once it has written more than output_limit bytes (setting.OUTPUT_LIMIT_MB
+    by default). Only the first keep_bytes of stdout/stderr are kept.
+
+    The child is reaped with os.wait4, so its resource usage is measured:
+    CpuTime (user + sys seconds), WallTime (seconds from start to exit) and
+    PeakRssKB (maximum resident set size, see _peak_rss).
+
+    Memory and CPU limits are applied by limiter (limiter.default_limiter()
+    by default) when memory_mb is given; backends that measure the run
+    themselves (cgroup) override CpuTime and PeakRssKB. cpus, when given,
+    is the set of CPUs the program (and whatever it starts) may run on.
+
+    The program runs in a session of its own. On timeout or an early verdict
+    the whole process group is killed, and after the child is reaped any
+    process still left in its session is killed too and listed in Leaked.
+    The exit of the program itself is noticed even while such leftovers keep
+    stdout open, so they cannot turn a finished run into a TLE.
+
+    Returns a dict: Ret, Stdout, Stderr, TimedOut, WallTimedOut, OutputExceeded, Mismatch
+    (True when killed by the checker), Accepted (the checker verdict, None
+    without a checker), MemoryExceeded (killed for memory, cgroup backend
+    only), CpuTime, WallTime, PeakRssKB and Leaked (names of the processes
+    killed by the post-run sweep).
+    """
+    result = _new_result()
+    cpu_cap = timeout_sec * (1 + borderline_margin())
+    try:
+        limits = (limiter or _limiter.default_limiter()).start(memory_mb, cpu_cap, cpus)
+    except Exception as e:
+        result.update(Ret=-3, Stderr=str(e).encode('utf-8'))
+        return result
+    try:
+        return _run_limited(cmd, input_path, cwd, timeout_sec, cpu_cap, limits,
+                            _Output(stream_checker, output_limit, keep_bytes),
+                            timeout_sec * (wall_factor or wall_time_factor()), result)
+    finally:
+        limits.cleanup()
+
+
+async def run_program_async(cmd, input_path, timeout_sec, memory_mb=None, stream_checker=None, output_limit=None,
+                            keep_bytes=KEEP_BYTES, limiter=None, wall_factor=None, cpus=None, cwd=None):
+    """run_program as a coroutine: same arguments, limits and result, but the
+    waiting happens on the running event loop, so one thread can keep many
+    programs in flight.
+
+    The program is still started with subprocess.Popen and reaped with
+    os.wait4 rather than through asyncio.create_subprocess_exec, whose child
+    watcher reaps with waitpid and would lose the rusage (CpuTime, PeakRssKB).
+    stdout/stderr are read by loop readers as they are produced and the exit
+    is watched through a pidfd (polled on the sample tick without one).
+    Cancelling the coroutine kills the whole session of the program. The
+    leak sweep and the limiter cleanup run in the loop's default executor.
+    """
+    result = _new_result()
+    cpu_cap = timeout_sec * (1 + borderline_margin())
+    try:
+        limits = (limiter or _limiter.default_limiter()).start(memory_mb, cpu_cap, cpus)
+    except Exception as e:
+        result.update(Ret=-3, Stderr=str(e).encode('utf-8'))
+        return result
+    try:
+        return await _run_limited_async(cmd, input_path, cwd, timeout_sec, cpu_cap, limits,
+                                        _Output(stream_checker, output_limit, keep_bytes),
+                                        timeout_sec * (wall_factor or wall_time_factor()), result)
+    finally:
+        # removing a cgroup leaf may wait for its processes to die
+        await asyncio.get_running_loop().run_in_executor(None, limits.cleanup)
+
+
+def _new_result() -> dict:
+    return {'Ret': 0, 'Stdout': b'', 'Stderr': b'', 'TimedOut': False, 'WallTimedOut': False,
+            'OutputExceeded': False, 'Mismatch': False, 'Accepted': None,
+            'MemoryExceeded': False, 'CpuTime': 0.0, 'WallTime': 0.0, 'PeakRssKB': 0, 'Leaked': []}
+
+
+class _Output:
+    """stdout/stderr of one run: bounded copies, output limit and stream checker."""
+
+    def __init__(self, stream_checker, output_limit, keep_bytes):
+        self.checker = stream_checker
+        self.limit = output_limit if output_limit is not None else output_limit_bytes()
+        self.keep = keep_bytes
+        self.out = bytearray()
+        self.err = bytearray()
+        self.total = 0
+
+    def stdout(self, data: bytes):
+        """Take a stdout chunk; returns 'output' or 'mismatch' when the run must stop."""
+        self.total += len(data)
+        if len(self.out) < self.keep:
+            self.out += data[:self.keep - len(self.out)]
+        if self.total > self.limit:
+            return 'output'
+        if self.checker is not None and not self.checker.feed(data):
+            return 'mismatch'
+        return None
+
+    def stderr(self, data: bytes):
+        if len(self.err) < self.keep:
+            self.err += data[:self.keep - len(self.err)]
+
+
+def _spawn(cmd, input_path, cwd, limits, result):
+    """Start the program; returns (proc, started, rss_floor), or None with
+    Ret/Stderr of result set when it could not be started."""
+    try:
+        with open(input_path or os.devnull, 'rb') as fin:
+            started = time.monotonic()
+            proc = subprocess.Popen(shlex.split(cmd), stdin=fin, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    cwd=cwd, preexec_fn=limits.preexec, close_fds=True, start_new_session=True)
+        # read after exec: our peak can only have grown since the child inherited it
+        rss_floor = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except FileNotFoundError as e:
+        result.update(Ret=-2, Stderr=str(e).encode('utf-8'))
+        return None
+    except Exception as e:
+        result.update(Ret=-3, Stderr=str(e).encode('utf-8'))
+        return None
+    limits.spawned(proc.pid)
+    return proc, started, rss_floor
+
+
+def _settle(result, proc, output, started, rss_floor, hwm, usage, stop, limits, timeout_sec):
+    """Fill result once the program was reaped (usage from _reap)."""
+    result['Stdout'] = bytes(output.out)
+    result['Stderr'] = bytes(output.err)
+    if usage is not None:
+        ended, ru = usage
+        result['WallTime'] = ended - started
+        if ru is not None:
+            result.update(CpuTime=ru.ru_utime + ru.ru_stime, PeakRssKB=_peak_rss(ru.ru_maxrss, rss_floor, hwm))
+    result.update(limits.finish())
+    over_cpu = stop == 'cpu' or result['CpuTime'] > timeout_sec or proc.returncode == -signal.SIGXCPU
+    if stop == 'timeout' or over_cpu:
+        result.update(Ret=-1, TimedOut=True, WallTimedOut=stop == 'timeout' and not over_cpu,
+                      Stderr=result['Stderr'] or b'Timeout')
+        return result
+    result['Ret'] = proc.returncode
+    if stop == 'output':
+        result['OutputExceeded'] = True
+    elif stop == 'mismatch':
+        result.update(Mismatch=True, Accepted=False)
+    elif output.checker is not None:
+        result['Accepted'] = output.checker.finish()
+    return result
+
+
+def _run_limited(cmd, input_path, cwd, timeout_sec, cpu_cap, limits, output, wall, result):
+    spawned = _spawn(cmd, input_path, cwd, limits, result)
+    if spawned is None:
+        return result
+    proc, started, rss_floor = spawned
+
+    deadline = started + wall
+    stop = None
+    hwm = 0
+    # the first sample waits one interval so that exec has certainly completed
+    next_sample = started + RSS_SAMPLE_INTERVAL
+    usage = None
+    leaked = {}
+    sel = selectors.DefaultSelector()
+    sel.register(proc.stdout, selectors.EVENT_READ)
+    sel.register(proc.stderr, selectors.EVENT_READ)
+    try:
+        # sample until the program exits, even after it closed its pipes
+        while not stop and (sel.get_map() or usage is None):
+            now = time.monotonic()
+            remaining = deadline - now
+            if remaining <= 0:
+                if usage is None:
+                    stop = 'timeout'
+                break
+            if now >= next_sample and usage is None:
+                hwm = max(hwm, _vm_hwm_kb(proc.pid))
+                next_sample = now + RSS_SAMPLE_INTERVAL
+                if _cpu_seconds(proc.pid) > cpu_cap:
+                    stop = 'cpu'
+                    break
+                usage = _reap(proc, now)
+                if usage is not None and sel.get_map():
+                    # the program has exited but processes it started still
+                    # hold the pipes: kill them, then drain what is buffered
+                    _sweep(proc.pid, leaked)
+                    deadline = min(deadline, now + DRAIN_SECONDS)
+                    next_sample = deadline
+                continue
+            if not sel.get_map():
+                # pipes closed: the program is usually exiting, wait for it up to the next sample
+                usage = _reap(proc, min(deadline, next_sample))
+                continue
+            for key, _ in sel.select(min(remaining, max(next_sample - now, 0.0))):
+                data = os.read(key.fd, 65536)
+                if not data:
+                    sel.unregister(key.fileobj)
+                    continue
+                if key.fileobj is proc.stderr:
+                    output.stderr(data)
+                    continue
+                stop = output.stdout(data)
+                if stop:
+                    break
+
+        group_killed = False
+        if usage is None:
+            # stopped early (verdict, output limit, CPU or wall time)
+            _kill_group(proc)
+            group_killed = True
+            usage = _reap(proc)
+        _sweep(proc.pid, leaked, group_killed or bool(leaked))
+        result['Leaked'] = list(leaked.values())
+    finally:
+        sel.close()
+        proc.stdout.close()
+        proc.stderr.close()
+    return _settle(result, proc, output, started, rss_floor, hwm, usage, stop, limits, timeout_sec)
+
+
+def _pidfd(pid: int):
+    try:
+        return os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        return None
+
+
+async def _run_limited_async(cmd, input_path, cwd, timeout_sec, cpu_cap, limits, output, wall, result):
+    spawned = _spawn(cmd, input_path, cwd, limits, result)
+    if spawned is None:
+        return result
+    proc, started, rss_floor = spawned
+
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    err_fd = proc.stderr.fileno()
+    pipes = {proc.stdout.fileno(), err_fd}
+    exit_fd = _pidfd(proc.pid)
+    deadline = started + wall
+    stop = None
+    exited = False
+    hwm = 0
+    next_sample = started + RSS_SAMPLE_INTERVAL
+    usage = None
+    leaked = {}
+    group_killed = False
+
+    def on_pipe(fd):
+        nonlocal stop
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return
+        if not data:
+            loop.remove_reader(fd)
+            pipes.discard(fd)
+        elif fd == err_fd:
+            output.stderr(data)
+            return
+        elif not stop:
+            stop = output.stdout(data)
+        wake.set()
+
+    def on_exit():
+        nonlocal exited
+        loop.remove_reader(exit_fd)
+        exited = True
+        wake.set()
+
+    for fd in pipes:
+        os.set_blocking(fd, False)
+        loop.add_reader(fd, on_pipe, fd)
+    if exit_fd is not None:
+        loop.add_reader(exit_fd, on_exit)
+    try:
+        while not stop and (pipes or usage is None):
+            now = time.monotonic()
+            if usage is None and now >= next_sample:
+                hwm = max(hwm, _vm_hwm_kb(proc.pid))
+                next_sample = now + RSS_SAMPLE_INTERVAL
+                if _cpu_seconds(proc.pid) > cpu_cap:
+                    stop = 'cpu'
+                    break
+                exited = True
+            if usage is None and exited:
+                exited = False
+                usage = _reap(proc, now)
+                if usage is not None and pipes:
+                    # same as run_program: leftovers hold the pipes, kill them and drain
+                    await loop.run_in_executor(None, _sweep, proc.pid, leaked)
+                    deadline = min(deadline, now + DRAIN_SECONDS)
+                if usage is not None and not pipes:
+                    break
+            remaining = deadline - now
+            if remaining <= 0:
+                if usage is None:
+                    stop = 'timeout'
+                break
+            if usage is None:
+                remaining = min(remaining, max(next_sample - now, 0.0))
+            wake.clear()
+            try:
+                await asyncio.wait_for(wake.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+        if usage is None:
+            _kill_group(proc)
+            group_killed = True
+            delay = 0.0005
+            while usage is None:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.01)
+                usage = _reap(proc, time.monotonic())
+    finally:
+        for fd in pipes:
+            loop.remove_reader(fd)
+        if exit_fd is not None:
+            loop.remove_reader(exit_fd)
+            os.close(exit_fd)
+        if usage is None:
+            # cancelled: do not leave the program running
+            _kill_group(proc)
+            _reap(proc)
+            _sweep(proc.pid, leaked, True)
+        proc.stdout.close()
+        proc.stderr.close()
+    # the sweep may scan /proc: keep it off the loop
+    await loop.run_in_executor(None, _sweep, proc.pid, leaked, group_killed or bool(leaked))
+    result['Leaked'] = list(leaked.values())
+    return _settle(result, proc, output, started, rss_floor, hwm, usage, stop, limits, timeout_sec)
@@ -0,0 +1,127 @@
+"""Scratch directories the contestant programs run in.
+
+Every running test gets a directory of its own as working directory, so
+parallel runs of the same student cannot see each other's files and
+file-based problems (UseStdIn / UseStdOut false) can read InputFile and
+write OutputFile there. Directories are kept in a pool and emptied between
+jobs instead of being recreated; the pool holds at most as many as there
+were tests running at once.
+
+They live under setting.SANDBOX_ROOT, by default /dev/shm (tmpfs) when it is
+writable and the system temp directory otherwise, in a themis-<pid>
+directory removed when the process exits.
+"""
+import atexit
+import contextlib
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+
+import config
+
+_lock = threading.Lock()
+_default = None
+
+
+def default_root() -> str:
+    """setting.SANDBOX_ROOT, else /dev/shm when writable, else the temp dir."""
+    configured = config.get('SANDBOX_ROOT')
+    if configured:
+        return configured
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def _clear(path: str) -> bool:
+    """Remove everything inside path; False when something could not be removed."""
+    ok = True
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return False
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                # programs may leave read-only trees behind
+                os.chmod(entry.path, 0o700)
+                shutil.rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
+        except OSError:
+            ok = False
+    return ok
+
+
+class SandboxPool:
+    """Pool of reusable scratch directories under root/themis-<pid>."""
+
+    def __init__(self, root: str = None):
+        self.root = os.path.join(root or default_root(), f'themis-{os.getpid()}')
+        self._free = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> str:
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            n = next(self._counter)
+        path = os.path.join(self.root, f'box{n}')
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        return path
+
+    def release(self, path: str):
+        """Empty path and put it back in the pool (dropped if it cannot be emptied)."""
+        if _clear(path):
+            with self._lock:
+                self._free.append(path)
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+
+    @contextlib.contextmanager
+    def slot(self):
+        """with pool.slot() as box: an empty directory for the duration of one run."""
+        path = self.acquire()
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    def close(self):
+        with self._lock:
+            self._free.clear()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def stage_input(box: str, src: str, name: str) -> str:
+    """Put a copy of the test input src into box as name and return its path.
+
+    A copy and not a hard link: a program opening its InputFile for writing
+    must not be able to change the test data.
+    """
+    dst = os.path.join(box, name)
+    shutil.copyfile(src, dst)
+    return dst
+
+
+def read_output(box: str, name: str, limit: int):
+    """Bytes of the OutputFile name written in box (at most limit + 1 bytes,
+    so an oversized file can be told apart), or None when it is missing."""
+    try:
+        with open(os.path.join(box, name), 'rb') as f:
+            return f.read(limit + 1)
+    except (FileNotFoundError, IsADirectoryError):
+        return None
+
+
+def default_pool() -> SandboxPool:
+    """Process-wide pool, created on first use and removed at exit."""
+    global _default
+    with _lock:
+        if _default is None:
+            _default = SandboxPool()
+            atexit.register(_default.close)
+        return _default
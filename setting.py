@@ -22,3 +22,72 @@ default_setting = {
         "MemoryLimit": 1024
     }
 }
+
+# Số worker chấm song song (None = số nhân vật lý). Mỗi test đang chạy giữ một CPU của GRADING_CPUS
+GRADING_WORKERS = None
+
+# Dung lượng tối đa của cache biên dịch (MB), xoá theo LRU khi vượt
+COMPILE_CACHE_MAX_MB = 512
+
+# Bộ nhớ tối đa (MB) cho cache đáp án đã chuẩn hoá
+EXPECTED_CACHE_MAX_MB = 256
+
+# Dung lượng tối đa (MB) của đáp án đã chuẩn hoá lưu trên đĩa (data/expected_cache), xoá theo LRU khi vượt
+EXPECTED_CACHE_DISK_MB = 1024
+
+# Giới hạn output của bài làm (MB), vượt quá bị dừng với kết quả OLE
+OUTPUT_LIMIT_MB = 64
+
+# Sai số cho phép khi so sánh số thực (evaluator Real/Float)
+FLOAT_TOLERANCE = 1e-6
+
+# Cách giới hạn tài nguyên khi chạy bài: 'rlimit' hoặc 'cgroup'
+LIMITER_BACKEND = 'rlimit'
+
+# Thư mục cgroup v2 đã được cấp quyền (delegate) cho backend 'cgroup'
+CGROUP_ROOT = None
+
+# Đặt giới hạn giữa fork và exec; False = đặt ngay sau khi chạy bài (nhanh hơn nhưng mảng tĩnh quá MemoryLimit lọt qua)
+RLIMIT_BEFORE_EXEC = True
+
+# Giới hạn RLIMIT_NPROC cho bài làm (None = không đặt; tính trên mọi tiến trình của user chấm)
+MAX_PROCESSES = None
+
+# TLE được tính theo thời gian CPU; thời gian thực tối đa = TimeLimit x hệ số này
+WALL_TIME_FACTOR = 3
+
+# Kết quả có thời gian CPU cách TimeLimit trong khoảng này (tỉ lệ của TL) được đánh dấu Borderline; bài chỉ bị dừng khi vượt TL x (1 + hệ số này)
+BORDERLINE_MARGIN = 0.1
+
+# CPU dùng để chạy bài (mỗi CPU một test): None = một CPU cho mỗi nhân vật lý trừ một nhân dành cho biên dịch (chạy test khi đã biên dịch xong), [] = không ghim; biên dịch chạy song song với test trên các nhân còn lại
+GRADING_CPUS = None
+
+# Số lần chạy lại riêng (tuần tự, sau khi chấm song song xong) các test TLE hoặc sát giới hạn, lấy kết quả tốt nhất (0 = tắt)
+RERUN_COUNT = 3
+
+# Cách chạy test song song: 'threads' (mỗi test một thread) hoặc 'asyncio' (một event loop cho mọi test, tối đa GRADING_WORKERS test cùng lúc)
+TEST_RUNNER = 'threads'
+
+# Tổng MemoryLimit (MB) của các test chạy cùng lúc (test khác chờ đến khi đủ): None = 80% RAM còn trống lúc bắt đầu chấm, 0 = không giới hạn
+MEMORY_BUDGET_MB = None
+
+# Thứ tự chạy test: 'file', 'breadth' (test 1 của mọi thí sinh trước), 'shortest' (test nhanh trước, theo thời gian lần chấm trước), 'slowest'
+SCHEDULE_POLICY = 'file'
+
+# Số giây giữa hai lần ghi bảng điểm tạm thời (data/scoreboard.json) khi đang chấm
+SCOREBOARD_INTERVAL = 5
+
+# Thư mục chứa các thư mục chạy bài tạm thời: None = /dev/shm (tmpfs) nếu ghi được, nếu không thì thư mục tạm của hệ thống
+SANDBOX_ROOT = None
+
+# Bộ nhớ (MB) dùng để giữ sẵn input của test trong RAM (memfd); phần vượt quá được chép ra đĩa cục bộ. 0 = tắt
+STAGING_MEMORY_MB = 256
+
+# Thư mục chứa input được chép ra đĩa khi vượt STAGING_MEMORY_MB (None = thư mục tạm của hệ thống)
+STAGING_SPILL_DIR = None
+
+# Dung lượng tối đa (MB) của cache giải nén test từ file nén (.zip, .tar.gz, .gz), xoá theo LRU khi vượt
+ARCHIVE_CACHE_MB = 2048
+
+# Số luồng quét song song các thư mục con cấp đầu của folder đáp án / thí sinh
+SCAN_WORKERS = 8
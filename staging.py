@@ -0,0 +1,137 @@
+"""Test inputs staged in memory.
+
+With many students the same inputs are opened thousands of times, from the
+answers folder that may sit on a slow disk or a network share. The store
+reads each input once, on first use, into a sealed memfd; runs then open
+/proc/self/fd/<n> (a fresh read-only open of the memfd, with its own offset)
+instead of the original path. Inputs beyond setting.STAGING_MEMORY_MB go to a
+copy on local disk (setting.STAGING_SPILL_DIR, default: the temp dir), and
+an input that cannot be staged at all is read from its original path.
+
+Inputs are keyed by (path, Sha256 from the test manifest), so a test file
+that changed between two gradings of the same process is staged again.
+"""
+import atexit
+import fcntl
+import os
+import shutil
+import tempfile
+import threading
+
+import config
+
+_lock = threading.Lock()
+_default = None
+
+# memfd seals: the staged data can no longer be changed or resized
+_SEALS = (getattr(fcntl, 'F_SEAL_SEAL', 0) | getattr(fcntl, 'F_SEAL_SHRINK', 0)
+          | getattr(fcntl, 'F_SEAL_GROW', 0) | getattr(fcntl, 'F_SEAL_WRITE', 0))
+
+
+class InputStore:
+    """Staged copies of test inputs, at most budget_mb of them in memory."""
+
+    def __init__(self, budget_mb: int, spill_dir: str = None):
+        self.budget = int(budget_mb) * 1024 * 1024
+        self.used = 0
+        self.spill_base = spill_dir
+        self.spill_dir = None
+        self.spilled = 0
+        self._entries = {}
+        self._key_locks = {}
+        self._fds = []
+        self._lock = threading.Lock()
+
+    def path(self, src: str, sha256: str = None) -> str:
+        """Path to open instead of src: /proc/self/fd/<n> of its memfd, its
+        spilled copy, or src itself when it could not be staged."""
+        key = (src, sha256)
+        staged = self._entries.get(key)
+        if staged is not None:
+            return staged
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            staged = self._entries.get(key)
+            if staged is None:
+                staged = self._entries[key] = self._stage(src)
+        return staged
+
+    def _stage(self, src: str) -> str:
+        try:
+            size = os.path.getsize(src)
+        except OSError:
+            return src
+        with self._lock:
+            in_memory = hasattr(os, 'memfd_create') and self.used + size <= self.budget
+            if in_memory:
+                self.used += size
+        if in_memory:
+            try:
+                return self._to_memfd(src, size)
+            except OSError:
+                with self._lock:
+                    self.used -= size
+        try:
+            return self._spill(src)
+        except OSError:
+            return src
+
+    def _to_memfd(self, src: str, size: int) -> str:
+        fd = os.memfd_create(os.path.basename(src), os.MFD_CLOEXEC | os.MFD_ALLOW_SEALING)
+        try:
+            with open(src, 'rb') as fin:
+                offset = 0
+                while offset < size:
+                    sent = os.sendfile(fd, fin.fileno(), offset, size - offset)
+                    if not sent:
+                        break
+                    offset += sent
+            fcntl.fcntl(fd, fcntl.F_ADD_SEALS, _SEALS)
+        except Exception:
+            os.close(fd)
+            raise
+        with self._lock:
+            self._fds.append(fd)
+        return f'/proc/self/fd/{fd}'
+
+    def _spill(self, src: str) -> str:
+        with self._lock:
+            if self.spill_dir is None:
+                self.spill_dir = tempfile.mkdtemp(prefix=f'themis-stage-{os.getpid()}-', dir=self.spill_base)
+            self.spilled += 1
+            dst = os.path.join(self.spill_dir, f'{self.spilled}-{os.path.basename(src)}')
+        shutil.copyfile(src, dst)
+        os.chmod(dst, 0o444)
+        return dst
+
+    def close(self):
+        with self._lock:
+            fds, self._fds = self._fds, []
+            self._entries.clear()
+            self.used = 0
+        for fd in fds:
+            os.close(fd)
+        if self.spill_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+
+
+def input_path(src: str, sha256: str = None) -> str:
+    """Path a run should open for the test input src (src itself when
+    staging is off, setting.STAGING_MEMORY_MB = 0)."""
+    store = default_store()
+    return store.path(src, sha256) if store is not None else src
+
+
+def default_store():
+    """Process-wide InputStore built from the settings on first use (None when off)."""
+    global _default
+    with _lock:
+        if _default is None:
+            budget = config.get('STAGING_MEMORY_MB', 256, int)
+            if not budget:
+                return None
+            _default = InputStore(budget, config.get('STAGING_SPILL_DIR'))
+            atexit.register(_default.close)
+        return _default
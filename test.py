@@ -78,6 +78,19 @@ def show_student_details_scrollable(stdscr, target_name: str):
         TextLine.append("Thí sinh này không có dữ liệu thi.")
         add_line_to_pad("Thí sinh này không có dữ liệu thi.", indent=2)
 
+    compile_errors = found_student.get("CompileErrors")
+    if compile_errors:
+        add_line_to_pad("")
+        add_line_to_pad("--- LỖI BIÊN DỊCH ---")
+        TextLine.append("")
+        TextLine.append("--- LỖI BIÊN DỊCH ---")
+        for problem_name, err in compile_errors.items():
+            add_line_to_pad(f"BÀI THI: {problem_name}")
+            TextLine.append(f"BÀI THI: {problem_name}")
+            for err_line in err.splitlines():
+                add_line_to_pad(err_line, indent=2)
+                TextLine.append(err_line)
+
     content_height = pad_y
     scroll_pos = 0
 
@@ -179,6 +192,14 @@ def save_multiple_students(names: list[str], output_dir: str = "saved_results"):
         else:
             lines.append("Thí sinh này không có dữ liệu thi.")
 
+        compile_errors = student.get("CompileErrors")
+        if compile_errors:
+            lines.append("")
+            lines.append("--- LỖI BIÊN DỊCH ---")
+            for problem_name, err in compile_errors.items():
+                lines.append(f"BÀI THI: {problem_name}")
+                lines.extend(err.splitlines())
+
         # Lưu file riêng cho mỗi học sinh
         filepath = os.path.join(output_dir, f"{name}.txt")
         with open(filepath, "w", encoding="utf-8") as f:
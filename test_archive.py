@@ -0,0 +1,265 @@
+"""Test data shipped compressed.
+
+A problem folder may hold its tests in archives instead of plain files: a
+.zip or .tar.gz / .tgz (tests.zip with test01/GOC.INP ..., or one test01.zip
+per test) or single gzip files (test01/GOC.INP.gz). build_manifest indexes
+their members like plain files. A member's manifest Path is
+"<archive>!/<member>"; Size and Mtime describe the archive (so a changed
+archive is noticed by the usual stat check) and MemberSize the member.
+
+For grading, extracted() decompresses a member once into data/test_cache/,
+named by the member's sha256 so identical members are stored once. The cache
+is an on-disk LRU bounded by setting.ARCHIVE_CACHE_MB and shared by every
+student; members in use are never evicted. A tar archive can only be read
+as one stream, so reading one member caches the other members met on the
+way too (those not cached yet, while they fit): reading every test of a
+.tar.gz decompresses it about once, not once per test.
+"""
+import contextlib
+import gzip
+import hashlib
+import os
+import tarfile
+import tempfile
+import threading
+import zipfile
+from pathlib import Path
+
+import disk_lru
+
+CACHE_DIR = Path(__file__).resolve().parent / 'data' / 'test_cache'
+SEP = '!/'
+
+_lock = threading.Lock()
+_pins = {}
+_key_locks = {}
+_indexes = {}
+
+
+def archive_kind(name: str):
+    """'zip', 'tar' or 'gz' (single gzip file) from a file name, None otherwise."""
+    low = name.lower()
+    if low.endswith('.zip'):
+        return 'zip'
+    if low.endswith(('.tar.gz', '.tgz', '.tar')):
+        return 'tar'
+    if low.endswith('.gz'):
+        return 'gz'
+    return None
+
+
+def is_member(path: str) -> bool:
+    return bool(path) and SEP in path
+
+
+def member_path(archive: str, member: str) -> str:
+    return f'{archive}{SEP}{member}'
+
+
+def source_file(path: str) -> str:
+    """The file on disk holding path: its archive for a member, path itself otherwise."""
+    return path.split(SEP, 1)[0] if is_member(path) else path
+
+
+def _members(archive: str):
+    """Yield (member name, readable file) for every regular file, in archive order."""
+    kind = archive_kind(archive)
+    if kind == 'zip':
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    with zf.open(info) as f:
+                        yield info.filename, f
+    elif kind == 'tar':
+        with tarfile.open(archive, 'r:*') as tf:
+            for info in tf:
+                if info.isfile():
+                    yield info.name, tf.extractfile(info)
+    elif kind == 'gz':
+        with gzip.open(archive, 'rb') as f:
+            yield os.path.basename(archive)[:-3], f
+
+
+def index_archive(archive: str) -> dict:
+    """{member: manifest record} of an archive, hashing every member in one
+    pass; memoized per (path, size, mtime). Unreadable archives give {}."""
+    try:
+        st = os.stat(archive)
+    except OSError:
+        return {}
+    key = (archive, st.st_size, st.st_mtime_ns)
+    with _lock:
+        hit = _indexes.get(key)
+    if hit is not None:
+        return hit
+    records = {}
+    try:
+        for name, f in _members(archive):
+            h = hashlib.sha256()
+            size = 0
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+                size += len(chunk)
+            records[name] = {'Path': member_path(archive, name), 'Size': st.st_size, 'Mtime': st.st_mtime_ns,
+                             'MemberSize': size, 'Sha256': h.hexdigest()}
+    except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError):
+        records = {}
+    with _lock:
+        _indexes[key] = records
+    return records
+
+
+def describe_member(path: str):
+    """Manifest record of an archive member path (None when it is gone)."""
+    archive, member = path.split(SEP, 1)
+    rec = index_archive(archive).get(member)
+    return dict(rec) if rec else None
+
+
+def index_folder(prob_path: str) -> list:
+    """Members of every archive under a problem folder, as
+    (lower-case path components, member path) with the archive's own folders
+    (and name, for .zip / .tar archives) prepended to the member's."""
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(prob_path):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            kind = archive_kind(fname)
+            if kind is None:
+                continue
+            archive = os.path.join(dirpath, fname)
+            prefix = os.path.relpath(dirpath, prob_path).split(os.sep)
+            prefix = [p.lower() for p in prefix if p != '.']
+            if kind != 'gz':
+                prefix.append(fname.lower().split('.', 1)[0])
+            for member in index_archive(archive):
+                entries.append((prefix + member.lower().split('/'), member_path(archive, member)))
+    return entries
+
+
+def find_members(entries: list, tc_name: str):
+    """(input, expected) member paths of test tc_name among index_folder entries:
+    members in a folder (or archive) named after the test, or named after it."""
+    tc = tc_name.lower()
+    found_in = found_out = None
+    for parts, path in entries:
+        stem, ext = os.path.splitext(parts[-1])
+        if tc not in parts[:-1] and stem != tc:
+            continue
+        if ext in ('.inp', '.in') and found_in is None:
+            found_in = path
+        elif ext == '.out' and found_out is None:
+            found_out = path
+    return found_in, found_out
+
+
+def evict(max_bytes: int = None):
+    """Remove least recently used members, never one in use, until the cache fits max_bytes."""
+    if max_bytes is None:
+        max_bytes = disk_lru.max_bytes('ARCHIVE_CACHE_MB', 2048)
+    disk_lru.evict(CACHE_DIR, max_bytes, keep=_pins)
+
+
+def _store(f) -> str:
+    """Copy a member into the cache under its sha256; returns the sha256."""
+    fd, tmp = tempfile.mkstemp(prefix='.tmp', dir=CACHE_DIR)
+    h = hashlib.sha256()
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+                out.write(chunk)
+        os.chmod(tmp, 0o444)
+        os.replace(tmp, CACHE_DIR / h.hexdigest())
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return h.hexdigest()
+
+
+def _extract(path: str):
+    archive, member = path.split(SEP, 1)
+    records = index_archive(archive)
+    limit = disk_lru.max_bytes('ARCHIVE_CACHE_MB', 2048)
+    need = (records.get(member) or {}).get('MemberSize', 0)
+    with _lock:
+        # make room before writing, not once the cache has overflowed
+        disk_lru.evict(CACHE_DIR, max(0, limit - need), keep=_pins)
+        used = disk_lru.usage(CACHE_DIR)
+    tar = archive_kind(archive) == 'tar'
+    found = False
+    for name, f in _members(archive):
+        if name == member:
+            _store(f)
+            if not tar:
+                return
+            found = True
+            used += need
+            continue
+        rec = records.get(name)
+        if not tar or rec is None or (CACHE_DIR / rec['Sha256']).is_file():
+            continue
+        if used + rec['MemberSize'] + (0 if found else need) > limit:
+            if found:
+                return
+            continue
+        _store(f)
+        used += rec['MemberSize']
+
+
+def _acquire(path: str, sha256: str = None) -> str:
+    if not sha256:
+        rec = describe_member(path)
+        if rec is None:
+            raise FileNotFoundError(path)
+        sha256 = rec['Sha256']
+    local = CACHE_DIR / sha256
+    with _lock:
+        _pins[sha256] = _pins.get(sha256, 0) + 1
+        key_lock = _key_locks.setdefault(sha256, threading.Lock())
+    try:
+        with key_lock:
+            if local.is_file():
+                disk_lru.touch(local)
+            else:
+                CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                _extract(path)
+                if not local.is_file():
+                    # the archive changed since it was indexed
+                    raise FileNotFoundError(path)
+        with _lock:
+            evict()
+    except BaseException:
+        _release(sha256)
+        raise
+    return str(local)
+
+
+def _release(sha256: str):
+    with _lock:
+        _pins[sha256] -= 1
+        if not _pins[sha256]:
+            del _pins[sha256]
+
+
+@contextlib.contextmanager
+def extracted(path: str, sha256: str = None):
+    """with extracted(path, sha256) as local: a file on disk for a manifest
+    path. Plain paths (and None) are passed through; an archive member is
+    extracted into the cache if needed and kept there while in use. local is
+    None when the member cannot be extracted."""
+    if not is_member(path):
+        yield path
+        return
+    try:
+        local = _acquire(path, sha256)
+    except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError):
+        yield None
+        return
+    try:
+        yield local
+    finally:
+        _release(os.path.basename(local))
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# the modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import checker  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def expected_cache(tmp_path, monkeypatch):
+    # keep the canonical expected outputs out of the repository's data/
+    monkeypatch.setattr(checker, '_default_cache', checker.ExpectedCache(cache_dir=tmp_path / 'expected_cache'))
@@ -0,0 +1,64 @@
+import pytest
+
+import checker
+
+NOT_UTF8 = [
+    b'caf\xc3\xa9\nx\xff\n',
+    b'1\xe9\xa0\xa0\n\xe9',
+]
+
+
+def _evaluate(tmp_path, name, expected: bytes, output: bytes):
+    path = tmp_path / 'expected.out'
+    path.write_bytes(expected)
+    cache = checker.ExpectedCache(cache_dir=tmp_path / 'cache')
+    ev = checker.get_evaluator(name)
+    whole = ev.check(output, str(path), cache=cache)
+    sc = ev.stream_checker(str(path), cache=cache)
+    streamed = None
+    if sc is not None:
+        fed = sc.feed(output)
+        streamed = (sc.finish() if fed else False, sc.diff)
+    return whole, streamed
+
+
+@pytest.mark.parametrize('data', NOT_UTF8)
+@pytest.mark.parametrize('name', ['lines', 'lines-ignorecase', 'C1LinesWordsIgnoreCase', 'C4WordsCase', 'bytes'])
+def test_identical_output_with_invalid_utf8_is_accepted(tmp_path, name, data):
+    whole, streamed = _evaluate(tmp_path, name, data, data)
+    assert whole == (True, None)
+    if streamed is not None:
+        assert streamed == (True, None)
+
+
+@pytest.mark.parametrize('name', ['lines', 'C2LinesWordsCase', 'C4WordsCase'])
+def test_stream_and_whole_output_agree_on_a_difference(tmp_path, name):
+    whole, streamed = _evaluate(tmp_path, name, b'caf\xc3\xa9\nx\xff\n', b'caf\xc3\xa9\nx\xfe\n')
+    assert whole[0] is False and streamed[0] is False
+    assert streamed[1]['Got'] == whole[1]['Got'] == 'x�'
+
+
+@pytest.mark.parametrize('out, exp, passed', [
+    (b'nan 1', b'nan 1.0000001', True),
+    (b'NaN', b'nan', False),
+    (b'inf -inf', b'inf -inf', True),
+    (b'1.5', b'1.6', False),
+])
+def test_compare_floats_same_rule_with_or_without_numpy(monkeypatch, out, exp, passed):
+    assert checker.compare_floats(out, exp, 1e-6)[0] is passed
+    monkeypatch.setattr(checker, 'np', None)
+    assert checker.compare_floats(out, exp, 1e-6)[0] is passed
+
+
+def test_expected_cache_directory_stays_under_its_cap(tmp_path):
+    cache_dir = tmp_path / 'expected_cache'
+    cache = checker.ExpectedCache(cache_dir=cache_dir, max_disk_bytes=8000)
+    for i in range(20):
+        path = tmp_path / f'{i}.out'
+        path.write_bytes(b'%d\n' % i * 500)
+        cache.get(str(path))
+        files = list(cache_dir.iterdir())
+        # trimmed every max_disk_bytes / 8 bytes saved
+        assert sum(f.stat().st_size for f in files) <= 8000 + 1000 + 2000
+    assert not any(f.name.startswith('.') for f in files)
+    assert len(files) < 20
@@ -0,0 +1,110 @@
+import os
+import shlex
+import sys
+
+import compile_cache
+import grader
+import setting
+
+
+def _job(tmp_path, source: str, time_limit: int = 1) -> dict:
+    prog = tmp_path / 'prog.py'
+    prog.write_text(source)
+    (tmp_path / 'test.inp').write_text('1 2\n')
+    (tmp_path / 'test.out').write_text('3\n')
+    return {
+        'Student': 0, 'Name': 'x', 'Problem': 'P', 'Index': 0, 'Test': 'test01',
+        'Cmd': f'{shlex.quote(sys.executable)} {shlex.quote(str(prog))}', 'Workdir': str(tmp_path),
+        'Input': str(tmp_path / 'test.inp'), 'Expected': str(tmp_path / 'test.out'),
+        'InputSha256': None, 'ExpectedSha256': None,
+        'TimeLimit': time_limit, 'MemoryLimit': None, 'Mark': 1.0, 'Evaluator': '',
+        'UseStdIn': True, 'UseStdOut': True, 'InputFile': 'P.INP', 'OutputFile': 'P.OUT',
+    }
+
+
+def test_clear_tle_is_not_borderline_and_rerun_once(tmp_path, monkeypatch):
+    job = _job(tmp_path, 'while True:\n    pass\n')
+    first, _, _ = grader.grade_test(job)
+    assert first['Verdict'] == 'TLE'
+    assert not first.get('Borderline')
+    assert grader.needs_rerun(first)
+
+    calls = []
+
+    def counted(job, cpu=None):
+        calls.append(job['Test'])
+        return grade_test(job, cpu)
+
+    grade_test = grader.grade_test
+    monkeypatch.setattr(grader, 'grade_test', counted)
+    tr, _, _ = grader.rerun_isolated(job, first, 3)
+    assert len(calls) == 1
+    assert tr['Verdict'] == 'TLE' and len(tr['Reruns']) == 1
+
+
+def test_borderline_only_near_the_limit():
+    assert grader.is_borderline(1.05, 1)
+    assert grader.is_borderline(0.95, 1)
+    assert not grader.is_borderline(1.2, 1)
+    assert not grader.is_borderline(0.5, 1)
+    # cut by the wall clock before using its CPU time: a busy machine
+    assert grader.is_borderline(0.1, 1, wall_timed_out=True)
+
+
+def test_oversized_output_file_is_ole(tmp_path, monkeypatch):
+    monkeypatch.setattr(setting, 'OUTPUT_LIMIT_MB', 1, raising=False)
+    job = _job(tmp_path, "with open('P.OUT', 'wb') as f:\n    f.write(b'3' * (3 << 20))\n")
+    job['UseStdOut'] = False
+    tr, _, _ = grader.grade_test(job)
+    assert tr['Verdict'] == 'OLE'
+
+
+def test_default_slots_keep_a_core_for_compiling(monkeypatch):
+    # two physical cores with two hyperthreads each
+    monkeypatch.setattr(grader, '_cpu_cores', lambda: {0: ('0', '0'), 1: ('0', '1'), 2: ('0', '0'), 3: ('0', '1')})
+    monkeypatch.setattr(grader.os, 'sched_getaffinity', lambda pid: {0, 1, 2, 3})
+    monkeypatch.setattr(setting, 'GRADING_CPUS', None, raising=False)
+    slots = grader.cpu_slots()
+    assert slots == [0]
+    assert grader.compile_cpus(slots) == [1, 3]
+
+
+def test_grade_all_goes_on_after_a_failing_compile(tmp_path):
+    test_dir = tmp_path / 'ans' / 'P' / 'test01'
+    test_dir.mkdir(parents=True)
+    (test_dir / 'P.INP').write_text('1 2\n')
+    (test_dir / 'P.OUT').write_text('3\n')
+    answers = {'P': {
+        'ExamInformation': {'UseStdIn': 'true', 'UseStdOut': 'true', 'TimeLimit': '1'},
+        'TestCases': [{'Name': 'test01', 'Mark': '1'}],
+        'Path': str(tmp_path / 'ans' / 'P'),
+    }}
+    prog = tmp_path / 'bob' / 'P.py'
+    prog.parent.mkdir()
+    prog.write_text('a, b = map(int, input().split())\nprint(a + b)\n')
+    students = [
+        # the source went missing after the scan: compile_cpp raises FileNotFoundError
+        {'Name': 'ann', 'BaiLam': {'P.cpp': str(tmp_path / 'ann' / 'P.cpp')}},
+        {'Name': 'bob', 'BaiLam': {'P.py': str(prog)}},
+    ]
+    stats = grader.grade_all(students, answers, workers=1)
+    assert stats['CompileErrors'] == 1
+    assert 'FileNotFoundError' in students[0]['CompileErrors']['P']
+    assert students[1]['Scores'] == {'P': 1.0}
+
+
+def test_compiled_binaries_are_kept_during_a_session(tmp_path, monkeypatch):
+    monkeypatch.setattr(compile_cache, 'CACHE_DIR', tmp_path / 'cache')
+    # a copy stands in for the compiler
+    monkeypatch.setattr(compile_cache, 'COMPILE_CMD', 'cp {src} {out}')
+    sources = []
+    for i in range(3):
+        sources.append(tmp_path / f'P{i}.cpp')
+        sources[-1].write_text(f'int main() {{ return {i}; }}\n')
+    with compile_cache.session():
+        bins = [compile_cache.compile_cpp(str(src))[0] for src in sources]
+        # with a cap of zero everything not pinned would go
+        compile_cache.evict(0)
+        assert all(os.path.exists(b) for b in bins)
+    compile_cache.evict(0)
+    assert not any(os.path.exists(b) for b in bins)
@@ -0,0 +1,22 @@
+import shutil
+import subprocess
+
+import pytest
+
+import limiter
+import runner
+
+STATIC_ARRAY = '''#include <cstdio>
+char a[1500u << 20];
+int main() { int i; if (std::scanf("%d", &i) != 1) i = 7; a[i] = 1; std::printf("%d\\n", a[i]); }
+'''
+
+
+@pytest.mark.skipif(shutil.which('g++') is None, reason='g++ not installed')
+def test_static_array_over_memory_limit_is_not_accepted(tmp_path):
+    (tmp_path / 'big.cpp').write_text(STATIC_ARRAY)
+    subprocess.run(['g++', '-O2', '-o', str(tmp_path / 'big'), str(tmp_path / 'big.cpp')], check=True)
+    lim = limiter.RlimitLimiter()
+    assert lim.before_exec and lim.name == 'rlimit'
+    res = runner.run_program(str(tmp_path / 'big'), None, 2, memory_mb=256, limiter=lim)
+    assert res['Ret'] != 0 and res['Stdout'] == b''
@@ -0,0 +1,67 @@
+import os
+
+import page
+
+
+def _scan(tmp_path):
+    """(students, meta) as a scan of the submissions folder gives them."""
+    students = {}
+    meta = {}
+    for name in ('alice', 'bob'):
+        bai_lam = {}
+        for fname in sorted(os.listdir(tmp_path / 'subs' / name)):
+            path = str(tmp_path / 'subs' / name / fname)
+            st = os.stat(path)
+            bai_lam[fname] = path
+            meta[path] = (st.st_size, st.st_mtime_ns)
+        students[name] = {'Name': name, 'BaiLam': bai_lam}
+    return students, meta
+
+
+def _graded(students: dict) -> list:
+    old = []
+    for name, s in students.items():
+        old.append(dict(s, Scores={'GOC': 1.0, 'SUM': 0.5},
+                        TestResults={'GOC': [{'Test': 'test01', 'Passed': True}],
+                                     'SUM': [{'Test': 'test01', 'Passed': False}]}))
+    return old
+
+
+def test_merge_previous_keeps_unchanged_pairs(tmp_path, monkeypatch):
+    monkeypatch.setattr(page, 'SNAPSHOT_PATH', tmp_path / 'snapshot.json')
+    exams = {'GOC': {}, 'SUM': {}}
+    for name in ('alice', 'bob'):
+        (tmp_path / 'subs' / name).mkdir(parents=True)
+        (tmp_path / 'subs' / name / 'GOC.py').write_text('print(1)\n')
+        (tmp_path / 'subs' / name / 'SUM.py').write_text('print(2)\n')
+    folder = str(tmp_path / 'subs')
+
+    students, meta = _scan(tmp_path)
+    # first scan of this folder: nothing to compare with
+    assert page._merge_previous(students, exams, folder, meta, []) is None
+    old = _graded(students)
+
+    (tmp_path / 'subs' / 'bob' / 'SUM.py').write_text('print(3)\n')
+    (tmp_path / 'subs' / 'alice' / 'SUM.py').unlink()
+    students, meta = _scan(tmp_path)
+    report = {}
+    stale = page._merge_previous(students, exams, folder, meta, old, report)
+
+    assert sorted(stale) == [('alice', 'SUM'), ('bob', 'SUM')]
+    assert report == {'Added': 0, 'Modified': 1, 'Removed': 1}
+    for name in ('alice', 'bob'):
+        assert students[name]['Scores'] == {'GOC': 1.0}
+        assert students[name]['TestResults'] == {'GOC': [{'Test': 'test01', 'Passed': True}]}
+
+
+def test_merge_previous_keeps_nothing_from_another_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(page, 'SNAPSHOT_PATH', tmp_path / 'snapshot.json')
+    for name in ('alice', 'bob'):
+        (tmp_path / 'subs' / name).mkdir(parents=True)
+        (tmp_path / 'subs' / name / 'GOC.py').write_text('print(1)\n')
+    students, meta = _scan(tmp_path)
+    page._merge_previous(students, {'GOC': {}}, str(tmp_path / 'subs'), meta, [])
+    old = _graded(students)
+    students, meta = _scan(tmp_path)
+    assert page._merge_previous(students, {'GOC': {}}, str(tmp_path / 'other'), meta, old) is None
+    assert all('Scores' not in s for s in students.values())
@@ -0,0 +1,63 @@
+import json
+
+import results_store
+
+
+def _data():
+    answers = {'GOC': {'ExamInformation': {'Mark': '1'}, 'TestCases': [{'Name': 'test01'}]},
+               'SUM': {'ExamInformation': {'Mark': '1'}, 'TestCases': [{'Name': 'test01'}]}}
+    students = [{'Name': 'alice', 'BaiLam': {'GOC.py': '/x/GOC.py'}},
+                {'Name': 'bob', 'BaiLam': {'SUM.cpp': '/x/SUM.cpp'}}]
+    return students, answers
+
+
+def _tr(test: str, passed: bool) -> dict:
+    return {'Test': test, 'Passed': passed, 'Verdict': 'AC' if passed else 'WA', 'MarkEarned': 1.0 if passed else 0.0}
+
+
+def _store(tmp_path):
+    store = results_store.ResultsStore(tmp_path / 'results.db')
+    students, answers = _data()
+    store.sync(students, answers)
+    store.record_pair('alice', 'GOC', [_tr('test01', True)], 1.0)
+    store.record_pair('bob', 'SUM', [], 0.0, 'error: expected ;')
+    return store
+
+
+def test_sync_records_and_export_round_trip(tmp_path):
+    with _store(tmp_path) as store:
+        assert store.pair_results('alice', 'GOC') == [_tr('test01', True)]
+        store.export_json(tmp_path)
+    students = json.loads((tmp_path / 'students_submissions.json').read_text(encoding='utf-8'))
+    answers = json.loads((tmp_path / 'answers_settings.json').read_text(encoding='utf-8'))
+    assert [s['Name'] for s in students] == ['alice', 'bob']
+    assert students[0]['BaiLam'] == {'GOC.py': '/x/GOC.py'}
+    assert students[0]['TestResults'] == {'GOC': [_tr('test01', True)]}
+    assert students[1]['CompileErrors'] == {'SUM': 'error: expected ;'}
+    assert answers['GOC']['Students'] == {'alice': 1.0}
+    assert answers['SUM']['TestCases'] == [{'Name': 'test01'}]
+
+    # the exported JSON imports into a fresh store unchanged
+    with results_store.ResultsStore(tmp_path / 'copy.db') as copy:
+        copy.sync(students, answers)
+        assert copy.load() == (students, answers)
+
+
+def test_sync_drops_students_gone_from_the_scan(tmp_path):
+    with _store(tmp_path) as store:
+        students, answers = _data()
+        store.sync(students[1:], answers)
+        assert not store.has_pair('alice', 'GOC')
+        assert [s['Name'] for s in store.load()[0]] == ['bob']
+
+
+def test_clear_pairs_and_clear_results(tmp_path):
+    with _store(tmp_path) as store:
+        store.clear_pairs([('alice', 'GOC'), ('nobody', 'GOC')])
+        assert not store.has_pair('alice', 'GOC')
+        assert store.pair_results('alice', 'GOC') == []
+        assert store.has_pair('bob', 'SUM')
+        store.clear_results()
+        assert not store.has_pair('bob', 'SUM')
+        students, _ = store.load()
+        assert all('TestResults' not in s and 'CompileErrors' not in s for s in students)
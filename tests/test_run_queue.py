@@ -0,0 +1,65 @@
+import grader
+
+
+def _job(name: str, memory_mb):
+    return {'Test': name, 'MemoryLimit': memory_mb}
+
+
+def _pop_all(q: grader.RunQueue) -> list:
+    started = []
+    while True:
+        job = q.pop()
+        if job is None:
+            return started
+        started.append(job['Test'])
+
+
+def test_capacity_limits_running_tests():
+    q = grader.RunQueue(2)
+    for i in range(4):
+        q.push(_job(f't{i}', 64))
+    assert _pop_all(q) == ['t0', 't1']
+    q.release(_job('t0', 64))
+    assert _pop_all(q) == ['t2']
+
+
+def test_memory_budget_backfills_a_smaller_test():
+    q = grader.RunQueue(4, budget_mb=1000)
+    q.push(_job('big1', 600))
+    q.push(_job('big2', 600))
+    q.push(_job('small', 256))
+    # big2 does not fit next to big1, the later small test takes the slot
+    assert _pop_all(q) == ['big1', 'small']
+    assert q.used_mb == 856
+    q.release(_job('big1', 600))
+    assert _pop_all(q) == ['big2']
+
+
+def test_test_over_the_whole_budget_runs_alone():
+    q = grader.RunQueue(4, budget_mb=1000)
+    q.push(_job('small', 100))
+    q.push(_job('huge', 2000))
+    assert _pop_all(q) == ['small']
+    q.release(_job('small', 100))
+    assert _pop_all(q) == ['huge']
+    q.push(_job('after', 100))
+    assert q.pop() is None
+
+
+def test_lowest_key_first_then_push_order():
+    q = grader.RunQueue(10)
+    q.push(_job('a', 64), key=2)
+    q.push(_job('b', 128), key=1)
+    q.push(_job('c', 64), key=1)
+    q.push(_job('d', 64), key=0)
+    assert _pop_all(q) == ['d', 'b', 'c', 'a']
+    assert len(q) == 0
+
+
+def test_missing_memory_limit_costs_the_default(monkeypatch):
+    monkeypatch.setattr(grader, 'default_memory_limit', lambda: 512)
+    q = grader.RunQueue(4, budget_mb=1000)
+    q.push(_job('a', None))
+    q.push(_job('b', None))
+    assert _pop_all(q) == ['a']
+    assert q.used_mb == 512
@@ -0,0 +1,38 @@
+import tarfile
+
+import test_archive
+
+
+def _tar(tmp_path, count: int):
+    src = tmp_path / 'src'
+    src.mkdir()
+    with tarfile.open(tmp_path / 'tests.tar.gz', 'w:gz') as tf:
+        for i in range(count):
+            (src / f'test{i:02d}.INP').write_text(f'{i}\n' * 1000)
+            tf.add(src / f'test{i:02d}.INP', arcname=f'test{i:02d}/P.INP')
+    return str(tmp_path / 'tests.tar.gz')
+
+
+def test_tar_members_are_decompressed_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(test_archive, 'CACHE_DIR', tmp_path / 'cache')
+    stores = []
+    store = test_archive._store
+    monkeypatch.setattr(test_archive, '_store', lambda f: stores.append(1) or store(f))
+    archive = _tar(tmp_path, 10)
+    # reading test00 caches the members after it too, on the same pass
+    for i in range(10):
+        with test_archive.extracted(test_archive.member_path(archive, f'test{i:02d}/P.INP')) as local:
+            with open(local) as f:
+                assert f.readline() == f'{i}\n'
+    assert len(stores) == 10
+
+
+def test_extraction_keeps_the_cache_under_its_cap(tmp_path, monkeypatch):
+    monkeypatch.setattr(test_archive, 'CACHE_DIR', tmp_path / 'cache')
+    # room for three members (about 2-3 KB each)
+    monkeypatch.setattr(test_archive.disk_lru, 'max_bytes', lambda name, default: 8000)
+    archive = _tar(tmp_path, 10)
+    for i in range(10):
+        with test_archive.extracted(test_archive.member_path(archive, f'test{i:02d}/P.INP')) as local:
+            assert local is not None
+        assert test_archive.disk_lru.usage(tmp_path / 'cache') <= 8000
@@ -0,0 +1,146 @@
+"""Headless entry point: `python -m themis grade --answers DIR --submissions DIR --jobs N`
+and `python -m themis export` (regenerate the JSON files from data/results.db).
+
+Runs the same scan and grading code as the curses UI (page.process_answer_folder,
+page.process_student_folder, grader.grade_all) without curses, so grading can be
+scripted or run over SSH.
+"""
+import argparse
+import sys
+import time
+
+import grader
+import limiter
+import page
+import results_store
+import test_manifest
+
+
+def _print_progress(stream, interval: float):
+    """Return an on_result callback printing at most one progress line per interval."""
+    start = time.monotonic()
+    last = [0.0]
+
+    def on_result(job, tr, stdout, stderr, done, total):
+        now = time.monotonic()
+        if now - last[0] < interval and done < total:
+            return
+        last[0] = now
+        elapsed = now - start
+        rate = done / elapsed if elapsed > 0 else 0.0
+        stream.write(f"[{done}/{total}] {rate:.1f} test/s  {job['Name']} {job['Problem']} {job['Test']}\n")
+        stream.flush()
+
+    return on_result
+
+
+def _print_summary(students: list, answers: dict, elapsed: float, stream):
+    tests = passed = 0
+    compile_errors = 0
+    leaks = []
+    borderline = 0
+    for s in students:
+        compile_errors += len(s.get('CompileErrors', {}) or {})
+        for prob_name, trs in (s.get('TestResults') or {}).items():
+            tests += len(trs)
+            passed += sum(1 for t in trs if t.get('Passed'))
+            borderline += sum(1 for t in trs if t.get('Borderline'))
+            leaks.extend(f"{s.get('Name')} {prob_name} {t.get('Test')}: {', '.join(t['Leaked'])}"
+                         for t in trs if t.get('Leaked'))
+
+    stream.write("\n")
+    for s in sorted(students, key=lambda s: -sum(max(float(v), 0.0) for v in s.get('Scores', {}).values())):
+        scores = s.get('Scores', {})
+        total = sum(max(float(v), 0.0) for v in scores.values())
+        per_prob = "  ".join(f"{p}={float(scores.get(p, 0)):.2f}" for p in answers)
+        stream.write(f"{s.get('Name')}: {total:.2f}  ({per_prob})\n")
+    if leaks:
+        stream.write(f"\nTiến trình bị bỏ lại sau khi chạy ({len(leaks)} test, đã kill):\n")
+        for line in leaks:
+            stream.write(f"  {line}\n")
+    stream.write(f"\nThí sinh: {len(students)}  Bài: {len(answers)}  Test: {passed}/{tests} đúng"
+                 f"  Lỗi biên dịch: {compile_errors}  Thời gian: {elapsed:.1f}s\n")
+    if borderline:
+        stream.write(f"Sát giới hạn thời gian (Borderline): {borderline} test\n")
+
+
+def cmd_grade(args) -> int:
+    if args.answers:
+        report = {}
+        out_file, results = page.process_answer_folder(args.answers, report)
+        ok_count = sum(1 for v in results.values() if 'ExamInformation' in v)
+        print(f"Đã lưu index: {out_file} ({ok_count}/{len(results)} bài)")
+        print(page.scan_summary(report))
+    if args.submissions:
+        report = {}
+        out_students, students = page.process_student_folder(args.submissions, report)
+        print(f"Đã lưu danh sách thí sinh: {out_students} ({len(students)} thí sinh)")
+        print(page.scan_summary(report))
+
+    students, answers = grader.load_data()
+    if not students or not any('TestCases' in v for v in answers.values()):
+        print("Không có dữ liệu để chấm: cần --answers và --submissions (hoặc data/*.json)", file=sys.stderr)
+        return 2
+
+    lim = limiter.default_limiter()
+    if lim.fallback_reason:
+        print(f"Không dùng được cgroup ({lim.fallback_reason}), chuyển sang {lim.name}", file=sys.stderr)
+
+    start = time.monotonic()
+    on_result = None if args.quiet else _print_progress(sys.stdout, args.progress_interval)
+    test_manifest.refresh_all(answers)
+    with results_store.open_store() as store:
+        store.sync(students, answers)
+        try:
+            stats = grader.grade_all(students, answers, workers=args.jobs, on_result=on_result,
+                                     on_pair_done=store.record_student_pair,
+                                     previous=store.pair_results, force=args.force, runner=args.runner,
+                                     policy=args.schedule, on_scores=store.publish_scoreboard)
+        finally:
+            store.export_json()
+    elapsed = time.monotonic() - start
+
+    _print_summary(students, {k: v for k, v in answers.items() if 'TestCases' in v}, elapsed, sys.stdout)
+    print(f"Đã chạy: {stats['Run']} test  Dùng lại kết quả cũ: {stats['Reused']} test"
+          f"  Chạy lại riêng (TLE/sát giới hạn): {stats['Rerun']} test")
+    return 0
+
+
+def cmd_export(args) -> int:
+    with results_store.open_store() as store:
+        students_path, answers_path = store.export_json()
+    print(f"Đã xuất: {students_path}")
+    print(f"Đã xuất: {answers_path}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='themis', description='Chấm bài không cần giao diện curses.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    g = sub.add_parser('grade', help='quét folder và chấm toàn bộ bài làm')
+    g.add_argument('--answers', metavar='DIR', help='folder đáp án (bỏ qua: dùng data/answers_settings.json)')
+    g.add_argument('--submissions', metavar='DIR', help='folder bài làm (bỏ qua: dùng data/students_submissions.json)')
+    g.add_argument('--jobs', '-j', type=int, default=None, help='số worker song song (mặc định: số nhân vật lý)')
+    g.add_argument('--progress-interval', type=float, default=1.0, help='giây giữa hai dòng tiến độ')
+    g.add_argument('--quiet', '-q', action='store_true', help='không in tiến độ')
+    g.add_argument('--force', action='store_true', help='chấm lại toàn bộ, bỏ qua kết quả đã lưu')
+    g.add_argument('--runner', choices=('threads', 'asyncio'), default=None,
+                   help='cách chạy test song song (mặc định: setting.TEST_RUNNER)')
+    g.add_argument('--schedule', choices=grader.SCHEDULE_POLICIES, default=None,
+                   help='thứ tự chạy test: file, breadth (test 1 của mọi thí sinh trước), shortest, slowest'
+                        ' (mặc định: setting.SCHEDULE_POLICY)')
+    g.set_defaults(func=cmd_grade)
+
+    e = sub.add_parser('export', help='xuất data/results.db ra các file JSON')
+    e.set_defaults(func=cmd_export)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
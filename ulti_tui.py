@@ -209,8 +209,10 @@ def show_student_test_details(stdscr, student_name: str, data_dir: str):
 
 def draw_answers_table(stdscr, y_start: int, file_path: str = "answers_settings.json"):
     """If `file_path` exists, read it and draw a pretty ASCII table at y_start.
-    Table columns: 'Bài thi', <student names... or 'Null'>, 'Time', 'Ram'
-    Each row: exam name, scores per student (0 if missing), Time default, Ram default
+    Table columns: 'ID', 'Thí sinh', <problems...>, 'Tổng điểm', 'Time', 'Ram'
+    Each row: a student, scores per problem (0 if missing), then the largest
+    measured CPU time (s) and peak memory (MB) over the student's tests,
+    read from TestResults in students_submissions.json ('-' if not graded)
     Returns number of lines drawn.
     """
     # use data/ folder inside project
@@ -234,6 +236,7 @@ def draw_answers_table(stdscr, y_start: int, file_path: str = "answers_settings.
 
     # Kiểm tra có file students_submissions.json không
     ss_path = os.path.join(data_dir, 'students_submissions.json')
+    usage = {}  # tên thí sinh -> (CPU time lớn nhất, RSS lớn nhất KB)
     if os.path.isfile(ss_path):
         try:
             with open(ss_path, 'r', encoding='utf-8') as sf:
@@ -246,6 +249,15 @@ def draw_answers_table(stdscr, y_start: int, file_path: str = "answers_settings.
             else:
                 student_names = []
             students.update([n for n in student_names if n])
+            if isinstance(sdata, list):
+                for s in sdata:
+                    if not isinstance(s, dict) or not s.get('Name'):
+                        continue
+                    tests = [t for trs in (s.get('TestResults') or {}).values() for t in trs]
+                    measured = [t for t in tests if 'CpuTime' in t]
+                    if measured:
+                        usage[s['Name']] = (max(float(t.get('CpuTime', 0)) for t in measured),
+                                            max(int(t.get('PeakRssKB') or 0) for t in measured))
         except Exception:
             pass
 
@@ -260,23 +272,14 @@ def draw_answers_table(stdscr, y_start: int, file_path: str = "answers_settings.
     headers = ["ID", "Thí sinh"] + list(data.keys()) + ["Tổng điểm", "Time", "Ram"]
 
     rows: List[List[str]] = []
-    # load global defaults to resolve TimeLimit/MemoryLimit if exam has -1
-    try:
-        import setting as _setting
-        global_defaults = _setting.default_setting.get('ExamInfomation', {})
-    except Exception:
-        global_defaults = {}
 
     # First add student rows
     for idx, student in enumerate(student_cols):
         row = [str(idx + 1), student]  # ID and student name columns
-        student_time = "1"  # default
-        student_ram = "1024"  # default
 
         # Add scores for each problem and calculate total
         total_score = 0.0
         for exam_name, v in data.items():
-            exam = v.get('ExamInformation', {})
             studs = v.get('Students', {}) or {}
             # Get student's score for this problem
             score = studs.get(student, 0)
@@ -284,19 +287,14 @@ def draw_answers_table(stdscr, y_start: int, file_path: str = "answers_settings.
             total_score += score_float
             row.append(f"{score_float:.2f}")
 
-            # Update student's time/ram limits if this problem requires more
-            try:
-                prob_time = int(exam.get('TimeLimit', 1))
-                prob_ram = int(exam.get('MemoryLimit', 1024))
-                student_time = str(max(int(student_time), prob_time))
-                student_ram = str(max(int(student_ram), prob_ram))
-            except:
-                pass
-
-        # Add total score, time and ram columns
+        # Add total score and the measured time/ram maxima
         row.append(f"{total_score:.2f}")
-        row.append(student_time)
-        row.append(student_ram)
+        if student in usage:
+            cpu, rss_kb = usage[student]
+            row.append(f"{cpu:.2f}")
+            row.append(f"{rss_kb / 1024:.1f}" if rss_kb else "-")
+        else:
+            row.extend(["-", "-"])
         rows.append(row)
 
     # Then add a row showing max marks possible for each problem